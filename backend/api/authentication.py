@@ -0,0 +1,101 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from recipes.versions import get_version, shared_cache, stored_user_version
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Токены с их пользователями в памяти процесса: не больше
+    AUTH_TOKEN_CACHE_SIZE записей, давно не использованные
+    вытесняются (LRU), записи старше AUTH_TOKEN_CACHE_TTL
+    не выдаются.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= settings.AUTH_TOKEN_CACHE_TTL:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+def shared_key(key):
+    """Ключ общего кеша: сам токен в кеш не попадает."""
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_version(user):
+    if shared_cache():
+        return get_version(f'user:{user.pk}')
+    return stored_user_version(user.pk)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к базе: токен
+    с пользователем берется из памяти процесса, а при
+    AUTH_TOKEN_SHARED_CACHE - еще и из общего кеша Django.
+    Запись действует, пока не изменилась версия пользователя:
+    ее меняют сохранение и удаление пользователя (смена пароля,
+    деактивация, правка профиля), удаление токена (выход)
+    и изменение счетчиков пользователя. Каждый запрос получает
+    свою копию объекта пользователя.
+    Версия читается до чтения токена из базы: если
+    пользователь изменится между ними, запись не совпадет
+    с новой версией. Поэтому впервые увиденный токен
+    запоминается без версии и проверяется по ней со
+    следующего запроса. Без общего кеша Django (Redis,
+    Memcached, файлового) версии в нем не видны другим
+    процессам, и запись проверяется по версии пользователя
+    в базе (User.version) одним запросом по первичному ключу;
+    она читается вместе с пользователем, и запись сразу
+    запоминается с ней.
+    """
+
+    def authenticate_credentials(self, key):
+        shared = shared_cache()
+        entry = token_cache.get(key)
+        if (entry is None and shared
+                and settings.AUTH_TOKEN_SHARED_CACHE):
+            entry = cache.get(shared_key(key))
+        version = None
+        if entry is not None:
+            user, token, cached_version = entry
+            version = user_version(user)
+            if version == cached_version:
+                token_cache.set(key, entry)
+                return copy.copy(user), token
+        user, token = super().authenticate_credentials(key)
+        if not shared:
+            version = user.version
+        entry = (user, token, version)
+        token_cache.set(key, entry)
+        if shared and settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.set(shared_key(key), entry,
+                      settings.AUTH_TOKEN_CACHE_TTL)
+        return copy.copy(user), token
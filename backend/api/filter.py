@@ -1,5 +1,7 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Basket, Favorite, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -15,17 +17,20 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',)
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search',)
 
     def get_is_favorited(self, queryset, name, value):
         """
         Обработка фильтром параметра is_favorited.
         """
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'))))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
@@ -33,13 +38,13 @@ class RecipeFilter(FilterSet):
         Обработка фильтром параметра is_in_shopping_cart.
         """
         if self.request.user.is_authenticated and value:
-            return queryset.filter(baskets__user=self.request.user)
+            return queryset.filter(Exists(Basket.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'))))
         return queryset
 
-
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name', )
+    def get_search(self, queryset, name, value):
+        """
+        Обработка фильтром параметра search: полнотекстовый
+        поиск по названию и описанию, лучшие совпадения первыми.
+        """
+        return search_recipes(queryset, value)
@@ -0,0 +1,344 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from recipes import counters, shopping_list
+from recipes.models import (Basket, Favorite, Follow, Ingredient, IngredientIn,
+                            Recipe, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+BUDGET_PATH = os.path.join(settings.BASE_DIR, 'data/query_budget.json')
+COLD_ENDPOINTS = ('recipes-list', 'recipes-detail', 'feed')
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAA'
+    'ggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+def shared_caches(location):
+    """
+    Файловый кеш, общий для процессов, как в рабочем
+    окружении: с кешем в памяти процесса кеш токенов
+    отключается.
+    """
+    return {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }}
+
+
+class Dataset:
+    """
+    Набор данных для замеров: пользователи, рецепты с ингредиентами
+    и тегами, избранное, корзины и подписки.
+    Размер набора задается числом рецептов.
+    """
+
+    def __init__(self, scale, seed):
+        self.scale = scale
+        self.random = random.Random(seed)
+
+    def seed(self):
+        rnd = self.random
+        users_count = max(self.scale // 5, 10)
+        User.objects.bulk_create(
+            User(email=f'bench{i}@foodgram.ru', username=f'bench{i}',
+                 first_name='Имя', last_name='Фамилия',
+                 password='!')
+            for i in range(users_count)
+        )
+        users = list(User.objects.order_by('id'))
+        self.viewer, self.other = users[0], users[1]
+        self.token = Token.objects.create(user=self.viewer).key
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', slug=f'tag{i}', color=f'#0000{i:02d}')
+            for i in range(6)
+        )
+        self.tags = list(Tag.objects.values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(500)
+        )
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {i}', text='Описание рецепта',
+                   cooking_time=rnd.randint(5, 120),
+                   image='recipes/benchmark.png',
+                   author=rnd.choice(users))
+            for i in range(self.scale)
+        )
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        self.recipe = recipes[0]
+        IngredientIn.objects.bulk_create(
+            IngredientIn(recipe_id=recipe, ingredient_id=ingredient,
+                         amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(self.ingredients, rnd.randint(3, 10))
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rnd.sample(self.tags, rnd.randint(1, 3))
+        )
+        picked = rnd.sample(recipes, min(len(recipes) // 2, 50))
+        Favorite.objects.bulk_create(
+            Favorite(user=self.viewer, recipe_id=recipe) for recipe in picked)
+        Basket.objects.bulk_create(
+            Basket(user=self.viewer, recipe_id=recipe)
+            for recipe in picked[::2])
+        shopping_list.rebuild([self.viewer.id])
+        Favorite.objects.bulk_create(
+            (Favorite(user=user, recipe_id=rnd.choice(recipes))
+             for user in users[1:]), ignore_conflicts=True)
+        Follow.objects.bulk_create(
+            Follow(user=self.viewer, following=user)
+            for user in users[2:min(len(users), 22)])
+        self.own_recipe = Recipe.objects.create(
+            name='Свой рецепт', text='Описание', cooking_time=10,
+            image='recipes/benchmark.png', author=self.viewer).id
+        self.free_recipes = [
+            recipe for recipe in recipes if recipe not in picked][:20]
+        self.free_recipe = self.free_recipes[0]
+        self.unfollowed = [self.other.id] + [
+            user.id for user in users[22:41]]
+        counters.reconcile(Recipe, recipes)
+        counters.reconcile(User, [user.id for user in users])
+
+    def recipe_payload(self):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание нового рецепта',
+            'cooking_time': 30,
+            'image': IMAGE,
+            'tags': self.tags[:2],
+            'ingredients': [{'id': ingredient, 'amount': 100}
+                            for ingredient in self.ingredients[:10]],
+        }
+
+    def endpoints(self):
+        """
+        Замеряемые запросы: (имя, метод, url, тело, анонимно).
+        Запросы добавления и удаления идут парами,
+        чтобы не менять набор данных между повторами.
+        """
+        recipe, free, own = self.recipe, self.free_recipe, self.own_recipe
+        return [
+            ('tags', 'get', '/api/tags/', None, True),
+            ('ingredients', 'get',
+             '/api/ingredients/?' + urlencode({'name': 'ингредиент 1'}),
+             None, True),
+            ('users', 'get', '/api/users/', None, False),
+            ('recipes-list', 'get', '/api/recipes/', None, False),
+            ('recipes-list-50', 'get', '/api/recipes/?limit=50', None, False),
+            ('recipes-list-cursor', 'get', '/api/recipes/?limit=50&cursor=',
+             None, False),
+            ('recipes-list-anonymous', 'get', '/api/recipes/?limit=50',
+             None, True),
+            ('recipes-list-favorited', 'get',
+             '/api/recipes/?is_favorited=1&limit=50', None, False),
+            ('recipes-search', 'get', '/api/recipes/?' + urlencode(
+                {'search': 'рецепт 1', 'limit': 50}), None, False),
+            ('recipes-detail', 'get', f'/api/recipes/{recipe}/', None, False),
+            ('recipes-create', 'post', '/api/recipes/',
+             self.recipe_payload(), False),
+            ('recipes-update', 'patch', f'/api/recipes/{own}/',
+             self.recipe_payload(), False),
+            ('favorite-add', 'post', f'/api/recipes/{free}/favorite/',
+             None, False),
+            ('favorite-remove', 'delete', f'/api/recipes/{free}/favorite/',
+             None, False),
+            ('shopping_cart-add', 'post',
+             f'/api/recipes/{free}/shopping_cart/', None, False),
+            ('shopping_cart-remove', 'delete',
+             f'/api/recipes/{free}/shopping_cart/', None, False),
+            ('download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/', None, False),
+            ('download_shopping_cart-pdf', 'get',
+             '/api/recipes/download_shopping_cart/?format=pdf', None, False),
+            ('feed', 'get', '/api/recipes/feed/', None, False),
+            ('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None, False),
+            ('subscribe', 'post', f'/api/users/{self.other.id}/subscribe/',
+             None, False),
+            ('unsubscribe', 'delete',
+             f'/api/users/{self.other.id}/subscribe/', None, False),
+            ('favorite-add-bulk', 'post', '/api/recipes/favorite/',
+             {'ids': self.free_recipes}, False),
+            ('favorite-remove-bulk', 'delete', '/api/recipes/favorite/',
+             {'ids': self.free_recipes}, False),
+            ('shopping_cart-add-bulk', 'post', '/api/recipes/shopping_cart/',
+             {'ids': self.free_recipes}, False),
+            ('shopping_cart-remove-bulk', 'delete',
+             '/api/recipes/shopping_cart/', {'ids': self.free_recipes},
+             False),
+            ('subscribe-bulk', 'post', '/api/users/subscribe/',
+             {'ids': self.unfollowed}, False),
+            ('unsubscribe-bulk', 'delete', '/api/users/subscribe/',
+             {'ids': self.unfollowed}, False),
+        ]
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды замера запросов к API.
+    Создает временную базу данных, наполняет ее данными разного
+    объема и для каждого эндпоинта записывает число SQL-запросов,
+    время ответа и размер ответа. Завершается ошибкой, если число
+    запросов превышает бюджет из data/query_budget.json.
+    python manage.py benchmark_api
+    """
+    help = 'Замер числа запросов, времени и размера ответов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='10,100,1000',
+            help='Объемы набора данных (число рецептов) через запятую.')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Число повторов для замера времени.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора случайных чисел.')
+        parser.add_argument(
+            '--budget', default=BUDGET_PATH,
+            help='Путь к файлу бюджета запросов.')
+        parser.add_argument(
+            '--output', help='Сохранить результаты замеров в JSON-файл.')
+        parser.add_argument(
+            '--update-budget', action='store_true',
+            help='Записать текущее число запросов в файл бюджета.')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',')]
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    tempfile.TemporaryDirectory() as cache_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      IMAGE_JOBS_MODE='worker',
+                                      CACHES=shared_caches(cache_root)):
+                results = [
+                    self.run_scale(scale, options)
+                    for scale in scales
+                ]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        report = self.summarize(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['update_budget']:
+            with open(options['budget'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Бюджет записан в {options["budget"]}')
+            return
+        self.check_budget(report, options['budget'])
+
+    def run_scale(self, scale, options):
+        """
+        Наполнение базы и замер всех эндпоинтов на одном объеме.
+        Эндпоинты COLD_ENDPOINTS замеряются еще раз после очистки
+        кеша под именем с суффиксом -cold: так в бюджете отдельно
+        видна цена запроса с пустым кешем страниц, версий и токенов.
+        """
+        call_command('flush', interactive=False, verbosity=0)
+        dataset = Dataset(scale, options['seed'])
+        dataset.seed()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {dataset.token}')
+        anonymous = APIClient()
+        measurements = {}
+        for name, method, url, payload, is_anonymous in dataset.endpoints():
+            measurements[name] = self.measure(
+                anonymous if is_anonymous else client,
+                method, url, payload,
+                options['repeat'] if method == 'get' else 1,
+            )
+            self.report(scale, name, measurements[name])
+        for name, method, url, payload, is_anonymous in dataset.endpoints():
+            if name not in COLD_ENDPOINTS:
+                continue
+            cache.clear()
+            name = f'{name}-cold'
+            measurements[name] = self.measure(
+                anonymous if is_anonymous else client,
+                method, url, payload, 1)
+            self.report(scale, name, measurements[name])
+        return {'scale': scale, 'endpoints': measurements}
+
+    def report(self, scale, name, measurement):
+        self.stdout.write(
+            '{scale:>7} {name:<26} {status} {queries:>4} q '
+            '{ms:>9.2f} ms {bytes:>9} B'.format(
+                scale=scale, name=name, **measurement))
+
+    def measure(self, client, method, url, payload, repeat):
+        """
+        Замер запроса repeat раз. Число запросов - наибольшее
+        по всем повторам: первый повтор идет с еще не прогретым
+        кешем и должен укладываться в бюджет, как и остальные.
+        Время - медиана.
+        """
+        timings, counts = [], []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, payload,
+                                                   format='json')
+                body = response.getvalue()
+                timings.append((time.perf_counter() - started) * 1000)
+            counts.append(len(queries))
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {url}: {response.status_code} '
+                    f'{body[:200]!r}')
+        return {
+            'status': response.status_code,
+            'queries': max(counts),
+            'warm_queries': counts[-1],
+            'ms': statistics.median(timings),
+            'bytes': len(body),
+        }
+
+    def summarize(self, results):
+        """Наибольшее число запросов каждого эндпоинта по всем объемам."""
+        report = {}
+        for result in results:
+            for name, measurement in result['endpoints'].items():
+                report[name] = max(report.get(name, 0),
+                                   measurement['queries'])
+        return report
+
+    def check_budget(self, report, path):
+        with open(path, encoding='utf-8') as file:
+            budget = json.load(file)
+        errors = [
+            f'{name}: {queries} запросов при бюджете {budget.get(name)}'
+            for name, queries in sorted(report.items())
+            if name not in budget or queries > budget[name]
+        ]
+        if errors:
+            raise CommandError(
+                'Превышен бюджет запросов:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Бюджет запросов соблюден.'))
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+
+from api.utils import import_recipes
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.importer import read_objects
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды для пакетного импорта рецептов.
+    Файл JSON или JSON Lines читается потоково, рецепты
+    добавляются пачками, ошибки выводятся по номерам рецептов.
+    python manage.py import_recipes путь --author почта
+    """
+    help = 'Пакетный импорт рецептов из JSON или JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Путь к файлу JSON или JSON Lines, - для stdin.')
+        parser.add_argument(
+            '--author', required=True, help='Почта автора рецептов.')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.RECIPE_IMPORT_CHUNK_SIZE,
+            help='Размер пачки добавления.')
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Нет пользователя {options["author"]}.')
+        path = options['path']
+        if path != '-' and not os.path.exists(path):
+            raise CommandError(f'Нет файла {path}.')
+        with (open(path, 'rt', encoding='utf-8') if path != '-'
+              else sys.stdin) as file:
+            report = import_recipes(
+                author, read_objects(file), options['chunk_size'])
+        for error in report['errors']:
+            self.stderr.write(f'Рецепт {error["index"]}: ' + json.dumps(
+                error['errors'], ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено рецептов: {report["created"]}, '
+            f'с ошибками: {len(report["errors"])}.'))
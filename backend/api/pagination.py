@@ -1,9 +1,253 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from functools import partial, reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from foodgram.replicas import cache_timeout
+from recipes.versions import get_version
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+PAGING_PARAMS = {'page', 'limit', 'cursor', 'recipes_limit'}
+
+
+def estimated_count(queryset):
+    """
+    Оценка числа строк планировщиком PostgreSQL (reltuples)
+    для запроса без фильтров по большой таблице, иначе None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.PAGINATION_ESTIMATE_MIN:
+        return None
+    return int(row[0])
+
+
+def get_count(queryset, request, view, compute=True):
+    """
+    Число объектов списка и признак его точности.
+    Для таблицы без фильтров берется оценка планировщика.
+    Точное число для фильтров из cached_count_params вьюсета
+    кешируется до записи рецептов, избранного, корзин,
+    подписок или пользователей (версия counts) отдельно
+    для каждой базы: число с реплики может отставать.
+    Без compute число не считается запросом COUNT: вернет
+    оценку или число из кеша, а если их нет - (None, False).
+    """
+    if queryset.query.is_empty():
+        return 0, True
+    count = estimated_count(queryset)
+    if count is not None:
+        return count, False
+    params = set(request.query_params) - PAGING_PARAMS
+    if not params <= set(getattr(view, 'cached_count_params', ())):
+        if not compute:
+            return None, False
+        return queryset.count(), True
+    version = get_version('counts')
+    key = 'count:{}:{}:{}'.format(version, queryset.db, hashlib.md5(
+        str(queryset.query).encode()).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        if not compute:
+            return None, False
+        count = queryset.count()
+        cache.set(key, count,
+                  cache_timeout(settings.PAGINATION_COUNT_TTL, version))
+    return count, True
+
+
+class CountedPaginator(DjangoPaginator):
+    """
+    Пагинатор с заранее известным числом объектов.
+    При оценочном числе номер страницы не проверяется сверху,
+    а страница не обрезается по оценке.
+    """
+
+    def __init__(self, object_list, per_page, count, exact=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+        self.exact = exact
+
+    def validate_number(self, number):
+        if self.exact:
+            return super().validate_number(number)
+        number = int(number)
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинатор: страница выбирается условием по полям
+    ordering относительно курсора по индексу, без OFFSET,
+    поэтому время ответа не зависит от того, как далеко
+    пролистан список, а вставки не сдвигают страницы.
+    Курсор непрозрачен: значения полей последней строки
+    и направление в base64.
+    """
+    page_size = 6
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.reverse_field(field) for field in ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek(ordering, position))
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        self.next_position = self.previous_position = None
+        if rows and (has_more if not reverse else True):
+            self.next_position = self.position(rows[-1])
+        if rows and (has_more if reverse else position is not None):
+            self.previous_position = self.position(rows[0])
+        return rows
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def seek(ordering, position):
+        """Условие (поля) после position в порядке ordering."""
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(
+                **{other.lstrip('-'): value for other, value
+                   in zip(ordering[:index], position[:index])},
+                **{f'{name}__{lookup}': position[index]}))
+        return reduce(or_, conditions)
+
+    def position(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, data['p'])
+            ]
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return position, bool(data.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse=False):
+        data = {'p': [value.isoformat() if hasattr(value, 'isoformat')
+                      else value for value in position]}
+        if reverse:
+            data['r'] = 1
+        return base64.urlsafe_b64encode(
+            json.dumps(data, separators=(',', ':')).encode()).decode()
+
+    def get_link(self, position, reverse=False):
+        if position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        return self.get_link(self.next_position)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
 class MyPagination(PageNumberPagination):
     """
     Создание своего пагинатора.
+    С параметром cursor во вьюсетах с cursor_ordering список
+    листается keyset-пагинацией, без него - параметрами page и limit.
+    count берется из get_count, count_exact - точное ли оно.
+    Keyset-страницам число не нужно, и для них оно не
+    считается: count есть, только если оно уже в кеше или
+    оценено, иначе null.
     """
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        ordering = getattr(view, 'cursor_ordering', None)
+        keyset = (ordering
+                  and self.cursor_query_param in request.query_params)
+        self.count, self.count_exact = get_count(
+            queryset, request, view, compute=not keyset)
+        if not keyset:
+            self.django_paginator_class = partial(
+                CountedPaginator, count=self.count, exact=self.count_exact)
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination()
+        self.keyset.page_size = self.page_size
+        self.keyset.ordering = ordering
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            response = super().get_paginated_response(data)
+        else:
+            response = self.keyset.get_paginated_response(data)
+        response.data = {'count': self.count,
+                         'count_exact': self.count_exact, **response.data}
+        return response
@@ -0,0 +1,185 @@
+import codecs
+import json
+import re
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from recipes.images import Base64Decoder, InvalidImage
+from recipes.importer import read_objects
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+STRING_SPECIAL = re.compile(rb'["\\]')
+
+WHITESPACE = b' \t\r\n'
+
+
+class FileFieldScanner:
+    """
+    Разбор JSON-документа по частям. Строка в ключе field
+    объекта верхнего уровня не попадает в документ: она
+    декодируется из base64 во временный файл, а в документе
+    заменяется на null. Остальной документ копируется как есть.
+    """
+
+    def __init__(self, field):
+        self.field = field.encode()
+        self.document = bytearray()
+        self.depth = 0
+        self.expect = None
+        self.key = None
+        self.last_key = None
+        self.in_string = False
+        self.escape = False
+        self.decoder = None
+        self.upload = None
+
+    def feed(self, chunk):
+        position = 0
+        while position < len(chunk):
+            if self.decoder is not None:
+                position = self.feed_file(chunk, position)
+            elif self.in_string:
+                position = self.feed_string(chunk, position)
+            else:
+                self.feed_token(chunk[position:position + 1])
+                position += 1
+
+    def feed_file(self, chunk, position):
+        """Часть строки base64 до кавычки - в декодер."""
+        if self.escape:
+            self.escape = False
+            char = chunk[position:position + 1]
+            if char == b'/':
+                self.decoder.feed(char)
+            elif char not in b'nrt':
+                raise InvalidImage('Ожидается изображение в base64.')
+            return position + 1
+        match = STRING_SPECIAL.search(chunk, position)
+        end = match.start() if match else len(chunk)
+        self.decoder.feed(chunk[position:end])
+        if match is None:
+            return end
+        if chunk[end:end + 1] == b'\\':
+            self.escape = True
+            return end + 1
+        self.upload.size = self.decoder.close()
+        self.upload.content_type = (self.decoder.content_type
+                                    or self.upload.content_type)
+        self.upload.seek(0)
+        self.decoder = None
+        self.document += b'null'
+        return end + 1
+
+    def feed_string(self, chunk, position):
+        """Обычная строка копируется в документ целиком."""
+        if self.escape:
+            self.escape = False
+            end = position + 1
+        else:
+            match = STRING_SPECIAL.search(chunk, position)
+            end = match.start() + 1 if match else len(chunk)
+            special = chunk[end - 1:end] if match else b''
+            if special == b'\\':
+                self.escape = True
+            elif special == b'"':
+                self.in_string = False
+        self.document += chunk[position:end]
+        if self.key is not None:
+            if self.in_string:
+                self.key += chunk[position:end]
+            else:
+                self.key += chunk[position:end - 1]
+                self.last_key, self.key = bytes(self.key), None
+        return end
+
+    def feed_token(self, char):
+        """Символ вне строки: отслеживается позиция в объекте."""
+        top = self.depth == 1
+        if char == b'"':
+            if top and self.expect == 'value' \
+                    and self.last_key == self.field:
+                self.start_file()
+                self.expect = 'comma'
+                return
+            self.in_string = True
+            if top and self.expect == 'key':
+                self.key = bytearray()
+        elif char in b'{[':
+            self.depth += 1
+            if self.depth == 1:
+                self.expect = 'key' if char == b'{' else None
+        elif char in b'}]':
+            self.depth -= 1
+        elif char == b':' and top and self.expect == 'key':
+            self.expect = 'value'
+        elif char == b',' and top:
+            self.expect = 'key'
+        if top and self.expect == 'value' and char not in WHITESPACE \
+                and char != b':':
+            self.expect = 'comma'
+        self.document += char
+
+    def start_file(self):
+        if self.upload is not None:
+            self.upload.close()
+        self.upload = TemporaryUploadedFile(
+            self.field.decode(), 'application/octet-stream', 0, None)
+        self.decoder = Base64Decoder(self.upload)
+
+    def result(self):
+        if self.decoder is not None or self.in_string or self.depth:
+            raise ValueError('Unexpected end of document')
+        data = json.loads(self.document.decode())
+        if self.upload is not None and isinstance(data, dict):
+            data[self.field.decode()] = self.upload
+        return data
+
+    def close(self):
+        if self.upload is not None:
+            self.upload.close()
+
+
+class RecipeJSONParser(JSONParser):
+    """
+    JSON-парсер рецептов, не загружающий изображение в память:
+    тело читается частями, строка base64 ключа image сразу
+    декодируется во временный файл, остальной документ
+    разбирается json.loads. Ошибки изображения - ошибки поля image.
+    """
+    file_field = 'image'
+    chunk_size = 64 * 1024
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        scanner = FileFieldScanner(self.file_field)
+        try:
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                scanner.feed(chunk)
+            return scanner.result()
+        except InvalidImage as error:
+            scanner.close()
+            raise ParseError({self.file_field: [str(error)]})
+        except ValueError as error:
+            scanner.close()
+            raise ParseError(f'JSON parse error - {error}')
+
+
+class JSONItemsParser(BaseParser):
+    """
+    JSON-массив объектов или JSON Lines для пакетного импорта.
+    Вместо данных возвращается генератор объектов: тело
+    запроса читается по мере обработки, а не целиком.
+    """
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get(
+            'encoding', settings.DEFAULT_CHARSET)
+        return read_objects(codecs.getreader(encoding)(stream))
+
+
+class NDJSONParser(JSONItemsParser):
+    media_type = 'application/x-ndjson'
@@ -0,0 +1,90 @@
+from api.serializers import RecipeSerializer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from foodgram.replicas import cache_timeout
+from recipes import membership
+from recipes.models import Recipe
+from recipes.versions import get_versions
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def page_queryset(queryset):
+    """
+    Рецепты для выдачи из кеша: только поля, по которым
+    проверяется кешированное представление.
+    """
+    return queryset.select_related('author').only(
+        'id', 'pub_date', 'updated_at', 'author__id',
+        *(f'author__{field}' for field in AUTHOR_FIELDS))
+
+
+def payload_key(recipe_id, request):
+    """Ссылки в представлении зависят от адреса сайта."""
+    return f'recipe:{request.scheme}://{request.get_host()}:{recipe_id}'
+
+
+def stamp(recipe, versions):
+    """
+    Отметка актуальности представления: дата изменения
+    рецепта, данные автора и версии тегов и ингредиентов.
+    """
+    return (recipe.updated_at,
+            *(getattr(recipe.author, field) for field in AUTHOR_FIELDS),
+            *versions)
+
+
+def recipe_payloads(recipes, request):
+    """
+    Представления рецептов для пользователя запроса. Общая
+    для всех пользователей часть берется из кеша, если ее
+    отметка совпадает с recipes; остальные рецепты читаются
+    и сериализуются одним набором запросов и кешируются.
+    Поверх общей части накладываются флаги пользователя
+    из его множеств избранного, корзины и подписок.
+    Они в кеш не попадают, поэтому их изменение кеш
+    не сбрасывает. Представления, прочитанные с реплики
+    вскоре после смены версий тегов или ингредиентов,
+    кешируются ненадолго (cache_timeout).
+    """
+    versions = get_versions('tags', 'ingredients')
+    keys = {recipe.id: payload_key(recipe.id, request) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    payloads = {}
+    for recipe in recipes:
+        entry = cached.get(keys[recipe.id])
+        if entry is not None and entry[0] == stamp(recipe, versions):
+            payloads[recipe.id] = entry[1]
+    missing = [recipe.id for recipe in recipes if recipe.id not in payloads]
+    if missing:
+        entries = {}
+        for recipe in Recipe.objects.filter(
+                id__in=missing).with_viewer_state(AnonymousUser()):
+            payload = dict(RecipeSerializer(
+                recipe, context={'request': request}).data)
+            payloads[recipe.id] = payload
+            entries[keys[recipe.id]] = (stamp(recipe, versions), payload)
+        cache.set_many(entries, cache_timeout(
+            settings.RECIPE_CACHE_TTL, *versions))
+    sets = membership.get(request)
+    return [overlay(payloads[recipe.id], recipe, sets)
+            for recipe in recipes if recipe.id in payloads]
+
+
+def viewer_flags(recipe, sets):
+    """Избранное, корзина и подписка на автора по множествам."""
+    return (recipe.id in sets.favorites, recipe.id in sets.cart,
+            recipe.author_id in sets.follows)
+
+
+def overlay(payload, recipe, sets):
+    """Общее представление рецепта с флагами пользователя."""
+    is_favorited, is_in_shopping_cart, is_subscribed = viewer_flags(
+        recipe, sets)
+    return {
+        **payload,
+        'author': {**payload['author'], 'is_subscribed': is_subscribed},
+        'is_favorited': is_favorited,
+        'is_in_shopping_cart': is_in_shopping_cart,
+    }
@@ -0,0 +1,337 @@
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+
+
+class TrueTypeFont:
+    """
+    Минимальный разбор TrueType-шрифта: таблица символов
+    и ширины глифов, нужные для встраивания шрифта в PDF.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        self.name = re.sub(r'[^A-Za-z0-9-]', '',
+                           os.path.splitext(os.path.basename(path))[0])
+        count = self.unpack('>H', 4)[0]
+        self.tables, self.lengths = {}, {}
+        for position in range(12, 12 + 16 * count, 16):
+            tag, _, offset, length = self.unpack('>4sIII', position)
+            self.tables[tag.decode('latin-1')] = offset
+            self.lengths[tag.decode('latin-1')] = length
+        head, hhea = self.tables['head'], self.tables['hhea']
+        self.units = self.unpack('>H', head + 18)[0]
+        self.bbox = [self.scale(value)
+                     for value in self.unpack('>4h', head + 36)]
+        self.ascent, self.descent = (
+            self.scale(value) for value in self.unpack('>2h', hhea + 4))
+        metrics = self.unpack('>H', hhea + 34)[0]
+        self.widths = [
+            self.scale(self.unpack('>H', self.tables['hmtx'] + 4 * index)[0])
+            for index in range(metrics)
+        ]
+        self.glyphs = self.read_cmap()
+        self.count = self.unpack('>H', self.tables['maxp'] + 4)[0]
+        self.long_loca = self.unpack('>h', head + 50)[0] == 1
+
+    def unpack(self, fmt, offset):
+        return struct.unpack_from(fmt, self.data, offset)
+
+    def scale(self, value):
+        return round(value * 1000 / self.units)
+
+    def width(self, glyph):
+        return self.widths[min(glyph, len(self.widths) - 1)]
+
+    def read_cmap(self):
+        """Соответствие кодов символов номерам глифов."""
+        cmap = self.tables['cmap']
+        subtables = {}
+        for index in range(self.unpack('>H', cmap + 2)[0]):
+            platform, encoding, offset = self.unpack(
+                '>HHI', cmap + 4 + 8 * index)
+            subtables[(platform, encoding)] = cmap + offset
+        if (3, 10) in subtables:
+            return self.read_format12(subtables[(3, 10)])
+        return self.read_format4(subtables[(3, 1)])
+
+    def read_format12(self, offset):
+        glyphs = {}
+        for group in range(self.unpack('>I', offset + 12)[0]):
+            start, end, glyph = self.unpack('>3I', offset + 16 + 12 * group)
+            for code in range(start, end + 1):
+                glyphs[code] = glyph + code - start
+        return glyphs
+
+    def read_format4(self, offset):
+        glyphs = {}
+        segments = self.unpack('>H', offset + 6)[0] // 2
+        ends = offset + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        ranges = deltas + 2 * segments
+        for segment in range(segments):
+            end = self.unpack('>H', ends + 2 * segment)[0]
+            start = self.unpack('>H', starts + 2 * segment)[0]
+            delta = self.unpack('>h', deltas + 2 * segment)[0]
+            range_offset = self.unpack('>H', ranges + 2 * segment)[0]
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    position = (ranges + 2 * segment + range_offset
+                                + 2 * (code - start))
+                    glyph = self.unpack('>H', position)[0]
+                    if glyph:
+                        glyph = (glyph + delta) % 65536
+                else:
+                    glyph = (code + delta) % 65536
+                if glyph:
+                    glyphs[code] = glyph
+        return glyphs
+
+    def glyph_data(self, glyph):
+        if self.long_loca:
+            start, end = self.unpack('>2I', self.tables['loca'] + 4 * glyph)
+        else:
+            start, end = (2 * value for value in self.unpack(
+                '>2H', self.tables['loca'] + 2 * glyph))
+        offset = self.tables['glyf']
+        return self.data[offset + start:offset + end]
+
+    def components(self, data):
+        """Номера глифов, из которых собран составной глиф."""
+        if len(data) < 10 or struct.unpack_from('>h', data)[0] >= 0:
+            return
+        position = 10
+        while True:
+            flags, glyph = struct.unpack_from('>2H', data, position)
+            yield glyph
+            position += 8 if flags & 0x0001 else 6
+            if flags & 0x0008:
+                position += 2
+            elif flags & 0x0040:
+                position += 4
+            elif flags & 0x0080:
+                position += 8
+            if not flags & 0x0020:
+                return
+
+    def subset(self, glyphs):
+        """
+        Файл шрифта только с нужными глифами. Номера глифов
+        сохраняются, остальные глифы становятся пустыми.
+        """
+        keep = {0}
+        pending = list(glyphs)
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.count:
+                continue
+            keep.add(glyph)
+            pending.extend(self.components(self.glyph_data(glyph)))
+        glyf, loca = [], [0]
+        for glyph in range(self.count):
+            data = self.glyph_data(glyph) if glyph in keep else b''
+            data += b'\0' * (-len(data) % 4)
+            glyf.append(data)
+            loca.append(loca[-1] + len(data))
+        head = self.tables['head']
+        tables = {
+            tag: self.data[self.tables[tag]:
+                           self.tables[tag] + self.lengths[tag]]
+            for tag in ('OS/2', 'cmap', 'cvt ', 'fpgm', 'hhea', 'hmtx', 'maxp',
+                        'prep')
+            if tag in self.tables
+        }
+        tables['head'] = (self.data[head:head + 8] + b'\0' * 4
+                          + self.data[head + 12:head + 50]
+                          + struct.pack('>h', 1)
+                          + self.data[head + 52:head + 54])
+        tables['glyf'] = b''.join(glyf)
+        tables['loca'] = struct.pack(f'>{len(loca)}I', *loca)
+        return self.pack(tables)
+
+    @staticmethod
+    def pack(tables):
+        """Сборка файла TrueType из таблиц."""
+        count = len(tables)
+        power = 1 << (count.bit_length() - 1)
+        header = [struct.pack('>I4H', 0x00010000, count, 16 * power,
+                              power.bit_length() - 1, 16 * (count - power))]
+        body = []
+        offset = 12 + 16 * count
+        for tag in sorted(tables):
+            data = tables[tag]
+            padded = data + b'\0' * (-len(data) % 4)
+            checksum = sum(struct.unpack(f'>{len(padded) // 4}I', padded))
+            header.append(struct.pack('>4s3I', tag.encode('latin-1'),
+                                      checksum & 0xFFFFFFFF, offset,
+                                      len(data)))
+            body.append(padded)
+            offset += len(padded)
+        return b''.join(header + body)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    """Шрифт разбирается один раз на процесс."""
+    return TrueTypeFont(path)
+
+
+class PDFWriter:
+    """
+    Потоковая запись простого PDF-документа из строк текста.
+    Страницы выдаются по мере заполнения, поэтому память
+    не растет с длиной документа. Шрифт, дерево страниц и таблица
+    ссылок пишутся в конце файла.
+    В документ встраиваются только использованные глифы шрифта.
+    Без TrueType-шрифта используется встроенный Helvetica,
+    в котором нет кириллицы.
+    """
+
+    def __init__(self, font_path=None, font_size=11, title_size=14):
+        self.font = load_font(font_path) if font_path else None
+        self.font_size = font_size
+        self.title_size = title_size
+        self.leading = round(font_size * 1.4)
+        self.offsets = {}
+        self.position = 0
+        self.used = {}
+        self.last_id = 3
+
+    def render(self, title, lines):
+        """Генератор байтов PDF: заголовок и строки по одной."""
+        yield self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        per_page = (PAGE_HEIGHT - 2 * MARGIN) // self.leading - 2
+        pages = []
+        page = []
+        for line in lines:
+            page.append(line)
+            if len(page) == per_page:
+                yield from self.write_page(title if not pages else None,
+                                           page, pages)
+                page = []
+        if page or not pages:
+            yield from self.write_page(title if not pages else None,
+                                       page, pages)
+        yield from self.write_font()
+        kids = ' '.join(f'{pk} 0 R' for pk in pages)
+        yield self.write_object(2, (
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'
+        ).encode())
+        yield self.write_xref()
+
+    def write(self, data):
+        self.position += len(data)
+        return data
+
+    def new_id(self):
+        self.last_id += 1
+        return self.last_id
+
+    def write_object(self, pk, body):
+        self.offsets[pk] = self.position
+        return self.write(b'%d 0 obj\n' % pk + body + b'\nendobj\n')
+
+    def write_stream(self, pk, data, extra=b''):
+        data = zlib.compress(data)
+        return self.write_object(pk, (
+            b'<< /Length %d /Filter /FlateDecode %s>>\nstream\n'
+            % (len(data), extra) + data + b'\nendstream'))
+
+    def encode(self, text):
+        """Текст в виде шестнадцатеричной строки PDF."""
+        if not self.font:
+            return '<' + text.encode('cp1252', 'replace').hex() + '>'
+        glyphs = []
+        for char in text:
+            glyph = self.font.glyphs.get(ord(char), 0)
+            self.used.setdefault(glyph, char)
+            glyphs.append(glyph)
+        return '<' + ''.join(f'{glyph:04x}' for glyph in glyphs) + '>'
+
+    def write_page(self, title, lines, pages):
+        top = PAGE_HEIGHT - MARGIN
+        content = [f'BT {MARGIN} {top} Td {self.leading} TL']
+        if title:
+            content.append(
+                f'/F1 {self.title_size} Tf {self.encode(title)} Tj T* T*')
+        content.append(f'/F1 {self.font_size} Tf')
+        content.extend(f'{self.encode(line)} Tj T*' for line in lines)
+        content.append('ET')
+        content_id, page_id = self.new_id(), self.new_id()
+        yield self.write_stream(content_id, '\n'.join(content).encode())
+        yield self.write_object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R '
+            f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> '
+            f'/Contents {content_id} 0 R >>').encode())
+        pages.append(page_id)
+
+    def write_font(self):
+        if not self.font:
+            yield self.write_object(3, (
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                b'/Encoding /WinAnsiEncoding >>'))
+            return
+        font = self.font
+        cid_id, descriptor_id, file_id, unicode_id = (
+            self.new_id() for _ in range(4))
+        yield self.write_object(3, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{font.name} '
+            f'/Encoding /Identity-H /DescendantFonts [{cid_id} 0 R] '
+            f'/ToUnicode {unicode_id} 0 R >>').encode())
+        widths = ' '.join(f'{glyph} [{font.width(glyph)}]'
+                          for glyph in sorted(self.used))
+        yield self.write_object(cid_id, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{font.name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            f'/Supplement 0 >> /FontDescriptor {descriptor_id} 0 R '
+            f'/CIDToGIDMap /Identity /W [{widths}] >>').encode())
+        bbox = ' '.join(map(str, font.bbox))
+        yield self.write_object(descriptor_id, (
+            f'<< /Type /FontDescriptor /FontName /{font.name} /Flags 32 '
+            f'/FontBBox [{bbox}] /ItalicAngle 0 /Ascent {font.ascent} '
+            f'/Descent {font.descent} /CapHeight {font.ascent} /StemV 80 '
+            f'/FontFile2 {file_id} 0 R >>').encode())
+        data = font.subset(self.used)
+        yield self.write_stream(file_id, data, b'/Length1 %d ' % len(data))
+        yield self.write_stream(unicode_id, self.to_unicode())
+
+    def to_unicode(self):
+        """CMap для копирования текста из документа."""
+        lines = [
+            '/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            '/Supplement 0 >> def /CMapName /Adobe-Identity-UCS def '
+            '/CMapType 2 def',
+            '1 begincodespacerange <0000> <FFFF> endcodespacerange',
+        ]
+        used = sorted(self.used.items())
+        for start in range(0, len(used), 100):
+            chunk = used[start:start + 100]
+            lines.append(f'{len(chunk)} beginbfchar')
+            lines.extend(
+                f'<{glyph:04x}> <{char.encode("utf-16-be").hex()}>'
+                for glyph, char in chunk)
+            lines.append('endbfchar')
+        lines.append('endcmap CMapName currentdict /CMap defineresource '
+                     'pop end end')
+        return '\n'.join(lines).encode()
+
+    def write_xref(self):
+        size = max(self.offsets) + 1
+        rows = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        rows.extend(
+            b'%010d 00000 n \n' % self.offsets[pk] if pk in self.offsets
+            else b'0000000000 65535 f \n'
+            for pk in range(1, size))
+        rows.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n'
+                    b'%%%%EOF\n' % (size, self.position))
+        return b''.join(rows)
@@ -0,0 +1,91 @@
+import csv
+import json
+
+from api.pdf import PDFWriter
+from django.conf import settings
+from rest_framework import renderers
+
+TITLE = 'Список покупок:'
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """
+    Базовый рендерер выгрузки списка покупок.
+    stream(rows) выдает файл частями по строкам
+    (название, единица измерения, количество),
+    render() нужен для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = ' '.join(str(value) for value in data.values())
+        return b''.join(self.stream([], title=str(data)))
+
+    def stream(self, rows, title=TITLE):
+        raise NotImplementedError
+
+
+class PlainTextRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows, title=TITLE):
+        yield f'{title}\n'.encode()
+        for name, unit, amount in rows:
+            yield f'\n{name} - {amount}, {unit}'.encode()
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows, title=TITLE):
+        writer = csv.writer(Echo())
+        if title != TITLE:
+            yield writer.writerow([title]).encode()
+            return
+        yield writer.writerow(['name', 'measurement_unit', 'amount']).encode()
+        for row in rows:
+            yield writer.writerow(row).encode()
+
+
+class JSONRenderer(ExportRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return renderers.JSONRenderer().render(
+            data, accepted_media_type, renderer_context)
+
+    def stream(self, rows, title=TITLE):
+        separator = '['
+        for name, unit, amount in rows:
+            yield (separator + json.dumps(
+                {'name': name, 'measurement_unit': unit, 'amount': amount},
+                ensure_ascii=False)).encode()
+            separator = ','
+        yield b'[]' if separator == '[' else b']'
+
+
+class PDFRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, rows, title=TITLE):
+        writer = PDFWriter(settings.SHOPPING_LIST_PDF_FONT or None)
+        return writer.render(title, (
+            f'{name} - {amount}, {unit}' for name, unit, amount in rows))
+
+
+EXPORT_RENDERERS = [PlainTextRenderer, CSVRenderer, JSONRenderer, PDFRenderer]
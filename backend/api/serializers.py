@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes import images, jobs, membership, shopping_list
 from recipes.models import (Basket, Favorite, Follow, Ingredient, IngredientIn,
                             Recipe, Tag)
 from rest_framework import serializers
@@ -27,14 +32,41 @@ class IngredientGetSerializer(serializers.ModelSerializer):
 
 
 class IngredientPostSerializer(serializers.ModelSerializer):
-    """Сериализатор Ингредиентов в рецепте для записи."""
-    id = serializers.IntegerField(source='ingredient.id')
+    """
+    Сериализатор Ингредиентов в рецепте для записи.
+    Id берется из строки рецепта, без чтения продукта.
+    """
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientIn
         fields = ('id', 'amount')
 
 
+class TagIdsField(serializers.ListField):
+    """
+    Id тэгов рецепта. Наличие всех тэгов в базе проверяется
+    одним запросом, повторы отбрасываются.
+    """
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': serializers.PrimaryKeyRelatedField
+        .default_error_messages['does_not_exist'],
+    }
+
+    def to_internal_value(self, data):
+        ids = list(dict.fromkeys(super().to_internal_value(data)))
+        found = set(Tag.objects.filter(id__in=ids).values_list(
+            'id', flat=True))
+        for pk in ids:
+            if pk not in found:
+                self.fail('does_not_exist', pk_value=pk)
+        return ids
+
+    def to_representation(self, value):
+        return [tag.id for tag in value.all()]
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для Тега."""
     class Meta:
@@ -55,9 +87,10 @@ class UserGetSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Определяем подписчиков."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        return (request.user.is_authenticated and Follow.objects.
-                filter(user=request.user, following__id=obj.id).exists())
+        return obj.id in membership.get(request).follows
 
 
 class SignUpSerializer(UserCreateSerializer, UserGetSerializer):
@@ -70,13 +103,78 @@ class SignUpSerializer(UserCreateSerializer, UserGetSerializer):
                   'last_name', 'is_subscribed', 'password')
 
 
-class RecipeMinifieldSerializer(serializers.ModelSerializer):
+class ImageUploadField(serializers.ImageField):
+    """
+    Изображение файлом multipart или строкой base64, с заголовком
+    data:image/...;base64, или без него. Строку RecipeJSONParser
+    уже декодировал во временный файл, иначе она декодируется
+    здесь по частям. До постановки в очередь проверяются размер,
+    формат и число пикселей по заголовку изображения, декодирует
+    его фоновая задача. При чтении - ссылка на изображение.
+    """
+    default_error_messages = {
+        'invalid': 'Ожидается изображение файлом или в base64.',
+    }
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str):
+                data = self.decode(data)
+            if not isinstance(data, File):
+                self.fail('invalid')
+            if data.size > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise images.InvalidImage(
+                    f'Изображение больше {settings.RECIPE_IMAGE_MAX_SIZE} '
+                    f'байт.')
+            images.check_image(data)
+        except images.InvalidImage as error:
+            raise serializers.ValidationError(str(error))
+        return data
+
+    def decode(self, data):
+        if not data.isascii():
+            raise images.InvalidImage('Ожидается изображение в base64.')
+        upload = TemporaryUploadedFile(
+            self.field_name, 'application/octet-stream', 0, None)
+        decoder = images.Base64Decoder(upload)
+        for start in range(0, len(data), self.chunk_size):
+            decoder.feed(data[start:start + self.chunk_size].encode())
+        upload.size = decoder.close()
+        upload.seek(0)
+        return upload
+
+
+class ImageVariantsMixin:
+    """
+    Ссылки на уменьшенные варианты изображения рецепта в WebP
+    и JPEG и srcset по форматам. Пока вариантов нет, поля пустые
+    и используется исходное изображение.
+    """
+
+    def variant_urls(self, obj):
+        return images.variant_urls(
+            obj.image_variants, self.context.get('request'))
+
+    def get_image_variants(self, obj):
+        return self.variant_urls(obj)[0]
+
+    def get_image_srcset(self, obj):
+        return self.variant_urls(obj)[1]
+
+
+class RecipeMinifieldSerializer(ImageVariantsMixin,
+                                serializers.ModelSerializer):
     """
     Сериализатор краткой инф-ции модели рецептов.
     """
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image',
+                  'image_variants', 'image_srcset', 'image_status')
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -100,6 +198,13 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ).data
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массового добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False,
+        max_length=settings.BULK_MAX_IDS)
+
+
 class UserFollowGetSerialazer(UserGetSerializer):
     """
     Сериализатор данных о подписках пользователя,
@@ -118,6 +223,9 @@ class UserFollowGetSerialazer(UserGetSerializer):
 
     def get_recipes(self, obj):
         """Определяем рецепты автора."""
+        if hasattr(obj, 'first_recipes'):
+            return RecipeMinifieldSerializer(
+                obj.first_recipes, many=True).data
         request = self.context.get('request')
         if request.GET.get('recipes_limit'):
             recipes_limit = int(request.GET.get('recipes_limit'))
@@ -129,7 +237,7 @@ class UserFollowGetSerialazer(UserGetSerializer):
 
     def get_recipes_count(self, obj):
         """Определяем сколько рецептов у автора."""
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class UserFollowSerializer(serializers.ModelSerializer):
@@ -185,7 +293,7 @@ class BasketSerializer(serializers.ModelSerializer):
         ).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """Сериализатор информации о рецепте."""
     author = SignUpSerializer(read_only=True)
     tags = TagSerializer(many=True)
@@ -194,99 +302,185 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'author', 'name', 'image', 'text',
-                  'ingredients', 'tags', 'cooking_time',
-                  'is_in_shopping_cart', 'is_favorited')
+        fields = ('id', 'author', 'name', 'image', 'image_variants',
+                  'image_srcset', 'image_status', 'text', 'ingredients',
+                  'tags', 'cooking_time', 'is_in_shopping_cart',
+                  'is_favorited')
 
     def get_is_favorited(self, obj):
         """Определение избранных рецептов."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=request.user,
-                                       recipe__id=obj.id).exists()
+        return obj.id in membership.get(request).favorites
 
     def get_is_in_shopping_cart(self, obj):
         """Определение продуктов в корзине."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Basket.objects.filter(user=request.user,
-                                     recipe__id=obj.id).exists()
+        return obj.id in membership.get(request).cart
 
 
-class RecipeCreateSerializer(serializers.ModelSerializer):
+class RecipeCreateSerializer(ImageVariantsMixin,
+                             serializers.ModelSerializer):
     """Сериализатор создания и изменения рецептов."""
     ingredients = IngredientPostSerializer(
         many=True, source='ingredientsrecipes'
     )
     author = SignUpSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
-    image = Base64ImageField(max_length=None)
+    tags = TagIdsField()
+    image = ImageUploadField()
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'author', 'name', 'image', 'text',
-                  'ingredients', 'tags', 'cooking_time')
+        fields = ('id', 'author', 'name', 'image', 'image_variants',
+                  'image_srcset', 'image_status', 'text', 'ingredients',
+                  'tags', 'cooking_time')
 
     def validate(self, value):
-        """Проверка продуктов в рецепте."""
-        ingredients_list = []
+        """
+        Проверка продуктов в рецепте. Наличие всех продуктов
+        в базе проверяется одним запросом.
+        """
+        ingredient_ids = set()
         for ingredient in value.get('ingredientsrecipes'):
             if ingredient.get('amount') < 1:
                 raise serializers.ValidationError(
                     'Кол-во не должно быть равным нулю.'
                 )
-            check_id = ingredient['ingredient']['id']
-            check_ingredient = Ingredient.objects.filter(id=check_id)
-            if not check_ingredient.exists():
-                raise serializers.ValidationError(
-                    'Данного продукта нет в базе!'
-                )
-            if check_ingredient in ingredients_list:
+            check_id = ingredient['ingredient_id']
+            if check_id in ingredient_ids:
                 raise serializers.ValidationError(
                     'Продукт уже есть в рецепте!'
                 )
-            ingredients_list.append(check_ingredient)
+            ingredient_ids.add(check_id)
+        if ingredient_ids and self.unknown_ingredients(ingredient_ids):
+            raise serializers.ValidationError(
+                'Данного продукта нет в базе!'
+            )
         return value
 
+    def unknown_ingredients(self, ingredient_ids):
+        """Id продуктов, которых нет в базе."""
+        return ingredient_ids - set(Ingredient.objects.filter(
+            id__in=ingredient_ids).values_list('id', flat=True))
+
     def create_ingredients_tags(self, data_tags, ingredients, recipe):
-        """Изменение тэгов и игнредиентов рецепта."""
+        """Тэги и ингредиенты нового рецепта."""
         recipe.tags.add(*data_tags)
-        ingredient_list = []
-        for ingredient in ingredients:
-            if not IngredientIn.objects.filter(
-                ingredient_id=ingredient['ingredient']['id'],
-                    recipe=recipe).exists():
-                ingredient_list.append(
-                    IngredientIn(ingredient_id=ingredient['ingredient']['id'],
-                                 recipe=recipe,
-                                 amount=ingredient['amount']))
-            else:
-                raise serializers.ValidationError(
-                    'Продукты уже есть в рецепте!')
-        IngredientIn.objects.bulk_create(ingredient_list)
+        IngredientIn.objects.bulk_create(
+            IngredientIn(ingredient_id=ingredient['ingredient_id'],
+                         recipe=recipe, amount=ingredient['amount'])
+            for ingredient in ingredients)
         return recipe
 
+    def update_ingredients_tags(self, data_tags, ingredients, recipe):
+        """
+        Изменение тэгов и ингредиентов рецепта по разнице
+        с сохраненными: удаляются убранные строки, меняются
+        количества и добавляются новые, остальные не трогаются.
+        Вернет прежние и новые количества ингредиентов.
+        """
+        current_tags = set(recipe.tags.values_list('id', flat=True))
+        new_tags = set(data_tags)
+        if current_tags - new_tags:
+            recipe.tags.remove(*(current_tags - new_tags))
+        if new_tags - current_tags:
+            recipe.tags.add(*(new_tags - current_tags))
+        rows = {row.ingredient_id: row for row in IngredientIn.objects.filter(
+            recipe=recipe).only('id', 'ingredient_id', 'amount')}
+        old_amounts = {pk: row.amount for pk, row in rows.items()}
+        new_amounts = {ingredient['ingredient_id']: ingredient['amount']
+                       for ingredient in ingredients}
+        removed = rows.keys() - new_amounts.keys()
+        if removed:
+            IngredientIn.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for pk, amount in new_amounts.items():
+            if pk in rows and rows[pk].amount != amount:
+                rows[pk].amount = amount
+                changed.append(rows[pk])
+        IngredientIn.objects.bulk_update(changed, ['amount'])
+        IngredientIn.objects.bulk_create(
+            IngredientIn(ingredient_id=pk, recipe=recipe, amount=amount)
+            for pk, amount in new_amounts.items() if pk not in rows)
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
-        """Создание рецепта."""
+        """
+        Создание рецепта. Изображение обрабатывается фоновой
+        задачей, до ее завершения у рецепта состояние pending.
+        """
         data_tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredientsrecipes')
-        recipe = Recipe.objects.create(**validated_data)
+        image = validated_data.pop('image')
+        recipe = Recipe.objects.create(
+            **validated_data, image_status=Recipe.IMAGE_PENDING)
         recipe = self.create_ingredients_tags(data_tags, ingredients, recipe)
+        jobs.enqueue(recipe, image)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Изменение рецепта."""
+        """
+        Изменение рецепта. Сохраняются только переданные поля,
+        чтобы не затереть изображение, записанное фоновой задачей.
+        """
         data_tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredientsrecipes')
-        IngredientIn.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
-        instance = self.create_ingredients_tags(
-            data_tags, ingredients, instance)
-        super().update(instance, validated_data)
+        image = validated_data.pop('image', None)
+        with shopping_list.signals_suspended():
+            old_amounts, new_amounts = self.update_ingredients_tags(
+                data_tags, ingredients, instance)
+            shopping_list.update_recipe(instance, old_amounts, new_amounts)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        update_fields = [*validated_data, 'updated_at']
+        if image is not None:
+            instance.image_status = Recipe.IMAGE_PENDING
+            update_fields.append('image_status')
+            jobs.enqueue(instance, image)
+        instance.save(update_fields=update_fields)
         return instance
+
+
+class RecipeImportSerializer(RecipeCreateSerializer):
+    """
+    Рецепт пакетного импорта. Тэги и продукты проверяются
+    по множествам id из контекста tags и ingredients,
+    загруженным один раз на весь импорт. Изображение
+    необязательно.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = ImageUploadField(required=False)
+
+    class Meta:
+        model = Recipe
+        fields = ('name', 'image', 'text', 'ingredients', 'tags',
+                  'cooking_time')
+
+    def validate_tags(self, value):
+        if set(value) - self.context['tags']:
+            raise serializers.ValidationError('Такого тэга нет в базе!')
+        return list(dict.fromkeys(value))
+
+    def unknown_ingredients(self, ingredient_ids):
+        return ingredient_ids - self.context['ingredients']
+
+    def validate(self, value):
+        """Продукты - словарем {id продукта: количество}."""
+        value = super().validate(value)
+        value['ingredients'] = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in value.pop('ingredientsrecipes')}
+        return value
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.versions import bump_users
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(instance, **kwargs):
+    """Сброс кешированной аутентификации пользователя."""
+    bump_users([instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    """Выход: токен больше не действует."""
+    bump_users([instance.user_id])
@@ -0,0 +1,110 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from recipes import membership
+from recipes.models import Ingredient, IngredientIn, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAA'
+    'ggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CACHE_ROOT = tempfile.mkdtemp()
+
+LOCAL_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def shared_caches(location):
+    """
+    Файловый кеш, общий для процессов, как Redis в рабочем
+    окружении.
+    """
+    return {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_MODE='worker',
+                   CACHES=shared_caches(CACHE_ROOT))
+class APITestCase(TestCase):
+    """
+    Автор с рецептами, читатель и клиенты обоих по токену.
+    Кеш общий для процессов, как в рабочем окружении; он
+    и множества пользователей в памяти процесса очищаются
+    перед каждым тестом.
+    """
+    recipes_count = 8
+    # Размер списка без фильтров PostgreSQL оценивает отдельным запросом.
+    estimate_queries = int(connection.vendor == 'postgresql')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            first_name='Автор', last_name='Рецептов', password='pass')
+        cls.reader = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Рецептов', password='pass')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast',
+                                     color='#E26C2D')
+        cls.salt, cls.flour = Ingredient.objects.bulk_create([
+            Ingredient(name='соль', measurement_unit='г'),
+            Ingredient(name='мука', measurement_unit='г'),
+        ])
+        cls.recipes = []
+        for number in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание рецепта', cooking_time=10,
+                image='recipes/test.png')
+            recipe.tags.add(cls.tag)
+            IngredientIn.objects.create(recipe=recipe, ingredient=cls.salt,
+                                        amount=5)
+            IngredientIn.objects.create(recipe=recipe, ingredient=cls.flour,
+                                        amount=100)
+            cls.recipes.append(recipe)
+        cls.recipe = cls.recipes[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(CACHE_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.reset_caches()
+        self.client = self.token_client(self.reader)
+        self.author_client = self.token_client(self.author)
+        self.anonymous = APIClient()
+
+    def reset_caches(self):
+        cache.clear()
+        membership.store.entries.clear()
+        membership.store.size = 0
+
+    def token_client(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def warm(self, client, url):
+        """Прогреть кеши: впервые увиденный токен кешируется со второго."""
+        for _ in range(2):
+            client.get(url)
+
+    def write(self, client, method, url, data=None):
+        """Изменяющий запрос с выполнением действий после фиксации."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(client, method)(url, data, format='json')
@@ -0,0 +1,62 @@
+from recipes.models import Favorite, Follow, ShoppingListItem
+from rest_framework import status
+
+from .base import APITestCase
+
+
+class BulkTests(APITestCase):
+
+    def test_favorite_bulk(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        ids = [recipe.id for recipe in self.recipes[:4]] + [0]
+        with self.assertNumQueries(8):
+            response = self.write(self.client, 'post',
+                                  '/api/recipes/favorite/', {'ids': ids})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statuses = {str(result['id']): result.get('status', 'error')
+                    for result in response.data['results']}
+        self.assertEqual(statuses[str(self.recipe.id)], 'error')
+        self.assertEqual(statuses['0'], 'error')
+        self.assertEqual(Favorite.objects.filter(user=self.reader).count(), 4)
+        self.recipes[1].refresh_from_db()
+        self.assertEqual(self.recipes[1].favorites_count, 1)
+        response = self.write(self.client, 'delete', '/api/recipes/favorite/',
+                              {'ids': ids})
+        self.assertFalse(Favorite.objects.filter(user=self.reader).exists())
+        self.recipes[1].refresh_from_db()
+        self.assertEqual(self.recipes[1].favorites_count, 0)
+
+    def test_shopping_cart_bulk(self):
+        ids = [recipe.id for recipe in self.recipes[:3]]
+        self.write(self.client, 'post', '/api/recipes/shopping_cart/',
+                   {'ids': ids})
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader).values_list('ingredient_id', 'amount')),
+            {self.salt.id: 15, self.flour.id: 300})
+        self.write(self.client, 'delete', '/api/recipes/shopping_cart/',
+                   {'ids': ids[1:]})
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader).values_list('ingredient_id', 'amount')),
+            {self.salt.id: 5, self.flour.id: 100})
+        response = self.client.get(
+            f'/api/recipes/{ids[0]}/')
+        self.assertTrue(response.data['is_in_shopping_cart'])
+
+    def test_subscribe_bulk(self):
+        response = self.write(
+            self.client, 'post', '/api/users/subscribe/',
+            {'ids': [self.author.id, self.reader.id]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, following=self.author).exists())
+        self.assertFalse(Follow.objects.filter(
+            user=self.reader, following=self.reader).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_bulk_requires_ids(self):
+        response = self.client.post('/api/recipes/favorite/', {},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,71 @@
+from django.db.models import F
+from django.test import override_settings
+from django.utils.http import http_date
+from recipes.models import Tag, Version
+from rest_framework import status
+
+from .base import LOCAL_CACHES, APITestCase
+
+
+class ConditionalTests(APITestCase):
+
+    def test_tags_not_modified(self):
+        response = self.anonymous.get('/api/tags/')
+        etag = response['ETag']
+        response = self.anonymous.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        response = self.anonymous.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_same_second_change(self):
+        response = self.anonymous.get('/api/tags/')
+        self.assertNotIn('Last-Modified', response)
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        response = self.anonymous.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_not_modified_without_shared_cache(self):
+        for url in ('/api/tags/', '/api/ingredients/',
+                    f'/api/recipes/{self.recipe.id}/'):
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+        etag = self.client.get('/api/tags/')['ETag']
+        # Теги изменены другим процессом: его кеш этому не виден.
+        Version.objects.filter(name='tags').update(value=F('value') + 1)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_not_modified(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.warm(self.client, url)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.write(self.client, 'post', f'{url}favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'mirror.foodgram.ru'])
+    def test_recipe_etag_per_host(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag,
+                                   HTTP_HOST='mirror.foodgram.ru')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('mirror.foodgram.ru', response.data['image'])
+
+    def test_recipe_etag_per_user(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,33 @@
+from recipes.models import Recipe
+from users.models import User
+
+from .base import APITestCase
+
+
+class CounterTests(APITestCase):
+
+    def test_full_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.write(self.client, 'post',
+                   f'/api/recipes/{self.recipe.id}/favorite/')
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_set_password_keeps_counters(self):
+        user = User.objects.get(pk=self.reader.pk)
+        self.write(self.client, 'post',
+                   f'/api/users/{self.author.id}/subscribe/')
+        user.set_password('new-password')
+        user.save()
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('new-password'))
+        self.assertEqual(user.following_count, 1)
+
+    def test_counters_saved_explicitly(self):
+        self.recipe.favorites_count = 5
+        self.recipe.save(update_fields=['favorites_count'])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 5)
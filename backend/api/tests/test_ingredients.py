@@ -0,0 +1,44 @@
+from django.test import override_settings
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+from rest_framework import status
+
+from .base import APITestCase
+
+
+class IngredientSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'Соль морская', 'Морская капуста', 'Капуста', 'Сок'))
+
+    def names(self, query):
+        response = self.anonymous.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data]
+
+    def test_prefix_then_substring(self):
+        self.assertEqual(self.names('морск'),
+                         ['Морская капуста', 'Соль морская'])
+        self.assertEqual(self.names('капуст'),
+                         ['Капуста', 'Морская капуста'])
+        self.assertEqual(self.names('ская кап'), ['Морская капуста'])
+        self.assertEqual(self.names('пусто'), [])
+
+    def test_short_query(self):
+        self.assertEqual(self.names('ль'), ['соль', 'Соль морская'])
+        self.assertEqual(self.names('со'), ['Сок', 'соль', 'Соль морская'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=1)
+    def test_limit(self):
+        self.assertEqual(self.names('кап'), ['Капуста'])
+        self.assertEqual(self.names('орск'), ['Морская капуста'])
+
+    def test_grams(self):
+        grams = ingredient_index.refresh().grams
+        keys = ingredient_index.refresh().keys
+        self.assertEqual(sorted(keys[position] for position in grams['рск']),
+                         ['морская капуста', 'соль морская'])
@@ -0,0 +1,128 @@
+import json
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Basket, ShoppingListItem
+from users.models import User
+from rest_framework import status
+
+from .base import IMAGE, LOCAL_CACHES, APITestCase
+
+
+class InvalidationTests(APITestCase):
+
+    def test_logout(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code,
+                         status.HTTP_200_OK)
+        response = self.write(self.client, 'post', '/api/auth/token/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get('/api/users/me/').status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def token_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries
+                          if 'authtoken_token' in query['sql']]
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_token_cache_without_shared_cache(self):
+        url = '/api/users/me/'
+        self.client.get(url)
+        response, token_queries = self.token_queries(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_queries, [])
+        user = User.objects.get(pk=self.reader.pk)
+        user.first_name = 'Новое имя'
+        user.save()
+        response, token_queries = self.token_queries(url)
+        self.assertEqual(response.data['first_name'], 'Новое имя')
+        self.assertEqual(len(token_queries), 1)
+        response = self.write(self.client, 'post', '/api/auth/token/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_follow_bumps_stored_version(self):
+        version = User.objects.get(pk=self.reader.pk).version
+        self.write(self.client, 'post',
+                   f'/api/users/{self.author.id}/subscribe/')
+        reader = User.objects.get(pk=self.reader.pk)
+        self.assertGreater(reader.version, version)
+        self.assertEqual(reader.following_count, 1)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_follow_and_unfollow(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertFalse(self.client.get(url).data['author']['is_subscribed'])
+        self.assertEqual(self.client.get('/api/recipes/feed/').data[
+            'results'], [])
+        response = self.write(self.client, 'post',
+                              f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self.client.get(url).data['author']['is_subscribed'])
+        feed = self.client.get('/api/recipes/feed/?limit=100').data['results']
+        self.assertEqual(len(feed), self.recipes_count)
+        response = self.write(self.client, 'delete',
+                              f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.client.get(url).data['author']['is_subscribed'])
+        self.assertEqual(self.client.get('/api/recipes/feed/').data[
+            'results'], [])
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_membership_without_shared_cache(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.warm(self.client, url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(self.client.get(url).data['is_favorited'])
+        self.assertFalse([query for query in queries
+                          if 'recipes_favorite' in query['sql']])
+        # Запись другим процессом: множества этого процесса
+        # не поправлены, их сбрасывает версия пользователя в базе.
+        with self.captureOnCommitCallbacks():
+            self.client.post(f'{url}favorite/')
+        self.assertTrue(self.client.get(url).data['is_favorited'])
+        self.write(self.client, 'delete', f'{url}favorite/')
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+
+    def test_recipe_update(self):
+        recipe = self.recipes[-1]
+        url = f'/api/recipes/{recipe.id}/'
+        self.client.get(url)
+        self.client.get('/api/recipes/')
+        response = self.write(self.author_client, 'patch', url, {
+            'name': 'Новое название', 'text': 'Новое описание',
+            'cooking_time': 20, 'image': IMAGE, 'tags': [self.tag.id],
+            'ingredients': [{'id': self.salt.id, 'amount': 7}],
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        detail = self.client.get(url).data
+        self.assertEqual(detail['name'], 'Новое название')
+        self.assertEqual([(item['id'], item['amount'])
+                          for item in detail['ingredients']],
+                         [(self.salt.id, 7)])
+        listed = {item['id']: item['name'] for item
+                  in self.client.get('/api/recipes/').data['results']}
+        self.assertEqual(listed[recipe.id], 'Новое название')
+
+    def test_recipe_update_in_shopping_list(self):
+        Basket.objects.create(user=self.reader, recipe=self.recipe)
+        self.write(self.author_client, 'patch',
+                   f'/api/recipes/{self.recipe.id}/', {
+                       'name': self.recipe.name, 'text': self.recipe.text,
+                       'cooking_time': 10, 'image': IMAGE,
+                       'tags': [self.tag.id],
+                       'ingredients': [{'id': self.salt.id, 'amount': 7}],
+                   })
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader).values_list('ingredient_id', 'amount')),
+            {self.salt.id: 7})
+        content = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json')
+        rows = json.loads(b''.join(content.streaming_content))
+        self.assertEqual(len(rows), 1)
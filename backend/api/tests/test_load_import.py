@@ -0,0 +1,42 @@
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from recipes.models import Ingredient
+
+
+class LoadImportTests(TestCase):
+
+    def load(self, content, suffix='.csv'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('load_import', path, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_existing_compared_without_spaces(self):
+        Ingredient.objects.create(name='соль ', measurement_unit='г')
+        out, _ = self.load('соль,г\n  мука , г\n')
+        self.assertIn('уже в базе: 1', out)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['мука', 'соль '])
+
+    def test_malformed_rows(self):
+        out, err = self.load('соль,г\nмука\n,г\nсахар,г\n')
+        self.assertIn('новых: 2', out)
+        self.assertIn('Пропущено неполных строк: 2 (2, 3)', err)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['сахар', 'соль'])
+
+    def test_malformed_json(self):
+        _, err = self.load(
+            '{"name": "соль", "measurement_unit": "г"}\n{"name": "мука"}\n',
+            suffix='.jsonl')
+        self.assertIn('Пропущено неполных строк: 1 (2)', err)
+        self.assertEqual(Ingredient.objects.count(), 1)
@@ -0,0 +1,84 @@
+import base64
+import os
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from django.utils import timezone
+from recipes import images, media
+from recipes.models import ImageJob, MediaFile, Recipe
+from recipes.storage import recipe_storage
+from users.models import User
+
+from .base import IMAGE, APITestCase
+
+
+class MediaTests(APITestCase):
+
+    def old_file(self, content):
+        name = recipe_storage.save('recipes/image.png', ContentFile(content))
+        old = time.time() - 3600
+        os.utime(recipe_storage.path(name), (old, old))
+        return name
+
+    def test_collect_keeps_files_of_deleted_records(self):
+        name = self.old_file(b'image')
+        variant = self.old_file(b'variant')
+        MediaFile.objects.create(name=name,
+                                 variants={'card': {'webp': variant}})
+        MediaFile.objects.filter(name=name).update(
+            updated_at=timezone.now() - timedelta(hours=1))
+        deleted, removed = media.collect(grace=60)
+        self.assertEqual(deleted, 1)
+        self.assertEqual(removed, [])
+        self.assertTrue(recipe_storage.exists(variant))
+        deleted, removed = media.collect(grace=60)
+        self.assertEqual(deleted, 0)
+        self.assertEqual(sorted(removed), sorted([name, variant]))
+
+    def test_collect_keeps_referenced_files(self):
+        name = self.old_file(b'image')
+        media.acquire(name, {})
+        MediaFile.objects.filter(name=name).update(
+            updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(media.collect(grace=60), (0, []))
+        self.assertTrue(recipe_storage.exists(name))
+
+    def test_admin_image_goes_through_jobs(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        model_admin = admin.site._registry[Recipe]
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password='pass',
+            first_name='Админ', last_name='Сайта')
+        form = model_admin.get_form(request, recipe, change=True)(
+            data={'name': recipe.name, 'text': recipe.text,
+                  'cooking_time': recipe.cooking_time,
+                  'author': recipe.author_id, 'tags': [self.tag.id],
+                  'ingredients': [self.salt.id, self.flour.id]},
+            files={'image': SimpleUploadedFile(
+                'image.png', base64.b64decode(IMAGE.split(',')[1]))},
+            instance=recipe)
+        self.assertTrue(form.is_valid(), form.errors)
+        obj = form.save(commit=False)
+        with self.captureOnCommitCallbacks():
+            model_admin.save_model(request, obj, form, change=True)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, self.recipe.image.name)
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_PENDING)
+        self.assertTrue(ImageJob.objects.filter(recipe=recipe).exists())
+
+    def test_decode_upload_reads_file(self):
+        content = base64.b64decode(IMAGE.split(',')[1])
+        upload = default_storage.save('uploads/image.upload',
+                                      ContentFile(content))
+        _, extension, _ = images.decode_upload(upload)
+        self.assertEqual(extension, 'png')
+        legacy = default_storage.save('uploads/image.b64',
+                                      ContentFile(IMAGE.encode()))
+        with self.assertRaises(images.InvalidImage):
+            images.decode_upload(legacy)
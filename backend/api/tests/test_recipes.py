@@ -0,0 +1,237 @@
+import base64
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipes import search
+from recipes.models import Basket, Favorite, Follow, Ingredient, Recipe, Tag
+from rest_framework import status
+
+from .base import IMAGE, APITestCase
+
+
+class RecipeQueryTests(APITestCase):
+    """
+    Список и страница рецепта стоят постоянного числа запросов
+    при любом размере страницы и состоянии зрителя.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::2])
+        Basket.objects.bulk_create(
+            Basket(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[1::2])
+        Follow.objects.create(user=cls.reader, following=cls.author)
+
+    def cold_queries(self, url):
+        self.warm(self.client, url)
+        self.reset_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_queries(self):
+        url = '/api/recipes/?limit=3'
+        self.warm(self.client, url)
+        with self.assertNumQueries(1 + self.estimate_queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], self.recipes_count)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_list_queries_independent_of_page_size(self):
+        self.assertEqual(self.cold_queries('/api/recipes/?limit=2'),
+                         self.cold_queries('/api/recipes/?limit=8'))
+        url = f'/api/recipes/?limit={self.recipes_count}'
+        with self.assertNumQueries(1 + self.estimate_queries):
+            response = self.client.get(url)
+        flags = {recipe['id']: (recipe['is_favorited'],
+                                recipe['is_in_shopping_cart'],
+                                recipe['author']['is_subscribed'])
+                 for recipe in response.data['results']}
+        self.assertEqual(flags, {
+            recipe.id: (number % 2 == 0, number % 2 == 1, True)
+            for number, recipe in enumerate(self.recipes)})
+
+    def test_detail_queries(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.warm(self.client, url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['name'], self.recipe.name)
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertFalse(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    def test_anonymous_list_queries(self):
+        url = '/api/recipes/?limit=3'
+        self.anonymous.get(url)
+        with self.assertNumQueries(1 + self.estimate_queries):
+            response = self.anonymous.get(url)
+        self.assertFalse(any(recipe['is_favorited']
+                             for recipe in response.data['results']))
+
+
+class RecipeListTests(APITestCase):
+
+    def test_keyset_paging(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+        seen, urls = [], ['/api/recipes/?limit=3&cursor=']
+        while urls[-1]:
+            response = self.client.get(urls[-1])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            urls.append(response.data['next'])
+        self.assertEqual(seen, expected)
+        for url in urls[:-1]:
+            with self.assertNumQueries(1 + self.estimate_queries):
+                self.client.get(url)
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in previous.data['results']],
+            expected[3:6])
+
+    def test_keyset_paging_ignores_inserts(self):
+        first = self.client.get('/api/recipes/?limit=3&cursor=')
+        Recipe.objects.create(author=self.author, name='Новый рецепт',
+                              text='Описание', cooking_time=5,
+                              image='recipes/test.png')
+        second = self.client.get(first.data['next'])
+        expected = list(Recipe.objects.order_by('-pub_date', '-id').exclude(
+            name='Новый рецепт').values_list('id', flat=True))
+        self.assertEqual(
+            [recipe['id'] for recipe in second.data['results']],
+            expected[3:6])
+
+    def test_keyset_paging_skips_count(self):
+        self.warm(self.client, '/api/recipes/?limit=3')
+        url = f'/api/recipes/?author={self.author.id}&limit=3'
+        # Автор из фильтра и страница, без COUNT.
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{url}&cursor=')
+        self.assertIsNone(response.data['count'])
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.client.get(url)
+        response = self.client.get(f'{url}&cursor=')
+        self.assertEqual(response.data['count'], self.recipes_count)
+        self.assertTrue(response.data['count_exact'])
+
+    def test_invalid_cursor(self):
+        cursor = base64.urlsafe_b64encode(b'{"p": ["x"]}').decode()
+        response = self.client.get(f'/api/recipes/?cursor={cursor}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search(self):
+        soup = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Суп со свеклой',
+            cooking_time=60, image='recipes/test.png')
+        Recipe.objects.create(
+            author=self.author, name='Салат', text='Можно подать к борщу',
+            cooking_time=5, image='recipes/test.png')
+        response = self.client.get('/api/recipes/?search=борщ')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [recipe['name'] for recipe in response.data['results']]
+        self.assertEqual(names[0], soup.name)
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get('/api/recipes/?search=свекл')
+        self.assertEqual([recipe['name'] for recipe
+                          in response.data['results']], [soup.name])
+        self.assertEqual(response.data['count'], 1)
+
+    def test_search_without_words(self):
+        response = self.client.get('/api/recipes/?search=!!!')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_search_triggers_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER recipes_recipe_search_insert')
+        self.assertEqual(search.restore_sqlite_triggers('default'), 1)
+        soup = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Суп со свеклой',
+            cooking_time=60, image='recipes/test.png')
+        found = search.search_recipes(Recipe.objects.all(), 'свекл')
+        self.assertEqual([recipe.pk for recipe in found], [soup.pk])
+        self.assertGreater(found[0].rank, 0)
+
+
+class RecipeWriteTests(APITestCase):
+    """
+    Создание и изменение рецепта стоят одинакового числа
+    запросов при любом числе ингредиентов и тегов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tags = [cls.tag, *Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag-{number}',
+                color=f'#00000{number}') for number in range(3))]
+        cls.ingredients = [
+            cls.salt, cls.flour, *Ingredient.objects.bulk_create(
+                Ingredient(name=f'продукт {number}', measurement_unit='г')
+                for number in range(3))]
+
+    def setUp(self):
+        super().setUp()
+        self.warm(self.author_client, '/api/users/me/')
+
+    def payload(self, size, shift=0):
+        return {
+            'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'image': IMAGE,
+            'tags': [tag.id for tag in self.tags[:size]],
+            'ingredients': [{'id': ingredient.id, 'amount': 10 + shift}
+                            for ingredient in self.ingredients[:size]],
+        }
+
+    def write_queries(self, method, url, payload):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.write(self.author_client, method, url, payload)
+        self.assertLess(response.status_code, 300, response.data)
+        return response, len(queries)
+
+    def test_create_queries(self):
+        # Создание меняет версию автора: токен следующего запроса
+        # перечитывается, и так для каждого из сравниваемых.
+        self.write_queries('post', '/api/recipes/', self.payload(1))
+        _, small = self.write_queries('post', '/api/recipes/',
+                                      self.payload(1))
+        response, large = self.write_queries('post', '/api/recipes/',
+                                             self.payload(5))
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['tags'],
+                         [tag.id for tag in self.tags])
+        self.assertEqual(
+            sorted((item['id'], item['amount'])
+                   for item in response.data['ingredients']),
+            sorted((ingredient.id, 10) for ingredient in self.ingredients))
+
+    def test_update_queries(self):
+        small_url = f'/api/recipes/{self.recipes[0].id}/'
+        large_url = f'/api/recipes/{self.recipes[1].id}/'
+        self.write_queries('patch', small_url, self.payload(1))
+        self.write_queries('patch', large_url, self.payload(5))
+        _, small = self.write_queries('patch', small_url,
+                                      self.payload(1, shift=1))
+        response, large = self.write_queries('patch', large_url,
+                                             self.payload(5, shift=1))
+        self.assertEqual(small, large)
+        self.assertEqual(
+            sorted((item['id'], item['amount'])
+                   for item in response.data['ingredients']),
+            sorted((ingredient.id, 11) for ingredient in self.ingredients))
+
+    def test_unknown_tag(self):
+        payload = self.payload(1)
+        payload['tags'] = [self.tag.id, 0]
+        response = self.author_client.post('/api/recipes/', payload,
+                                           format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.data)
@@ -0,0 +1,80 @@
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from foodgram import replicas
+from recipes.models import Tag
+from rest_framework import status
+
+from .base import APITestCase
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTests(APITestCase):
+    """
+    Реплика - отдельная база SQLite в памяти со своими
+    тегами: по ответу видно, из какой базы он прочитан.
+    Она подключается после настройки класса и не входит
+    в его транзакции, поэтому ее теги удаляются после теста.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings[REPLICA] = connections.configure_settings({
+            **connections.settings,
+            REPLICA: {'ENGINE': 'django.db.backends.sqlite3',
+                      'NAME': ':memory:'}})[REPLICA]
+        # Роутер не применяет миграции к репликам из DATABASE_REPLICAS.
+        with override_settings(DATABASE_REPLICAS=[]):
+            call_command('migrate', database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        Tag.objects.using(REPLICA).create(name='С реплики', slug='replica',
+                                          color='#49B64E')
+        self.addCleanup(Tag.objects.using(REPLICA).all().delete)
+
+    def tag_names(self, client):
+        response = client.get('/api/tags/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in response.data]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.tag_names(self.client), ['С реплики'])
+        self.assertEqual(self.tag_names(self.anonymous), ['С реплики'])
+
+    def test_writes_go_to_default(self):
+        response = self.write(self.client, 'post',
+                              f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self.recipe.favorites.filter(
+            user=self.reader).exists())
+        self.assertFalse(Tag.objects.using(REPLICA).filter(
+            pk=self.tag.pk).exists())
+
+    def test_pinned_after_write(self):
+        response = self.write(self.client, 'post',
+                              f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.tag_names(self.client), [self.tag.name])
+        self.assertEqual(self.tag_names(self.author_client), ['С реплики'])
+
+    def test_pin_belongs_to_user(self):
+        response = self.write(self.client, 'post',
+                              f'/api/recipes/{self.recipe.id}/favorite/')
+        self.author_client.cookies[replicas.PIN_COOKIE] = response.cookies[
+            replicas.PIN_COOKIE].value
+        self.assertEqual(self.tag_names(self.author_client), ['С реплики'])
+
+    def test_forged_pin(self):
+        self.client.cookies[replicas.PIN_COOKIE] = str(self.reader.pk)
+        self.assertEqual(self.tag_names(self.client), ['С реплики'])
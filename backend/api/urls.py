@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (AllFolowViewSet, FollowView, IngredientViewSet,
-                    RecipeViewSet, TagViewSet, UserView)
+from .views import (AllFolowViewSet, BulkFollowView, FollowView,
+                    IngredientViewSet, RecipeViewSet, TagViewSet, UserView)
 
 router = DefaultRouter()
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
@@ -13,6 +13,8 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 urlpatterns = [
     path('users/subscriptions/', AllFolowViewSet.as_view({'get': 'list'}),
          name='subscriptions'),
+    path('users/subscribe/', BulkFollowView.as_view(),
+         name='subscribe-bulk'),
     path('users/<user_id>/subscribe/', FollowView.as_view(),
          name='subscribe'),
     path('', include(router.urls)),
@@ -1,7 +1,19 @@
+import hashlib
+
+from api.serializers import BulkIdsSerializer, RecipeImportSerializer
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from recipes import counters, membership
+from recipes.importer import create_recipes
+from recipes.models import Ingredient, Tag
 from rest_framework import status
 from rest_framework.response import Response
+from users.models import User
 
 
+@transaction.atomic(savepoint=False)
 def post_instance(request, instance, serializer):
     """Добавление в избарнное или в корзину."""
     serializer = serializer(
@@ -10,14 +22,172 @@ def post_instance(request, instance, serializer):
     )
     serializer.is_valid(raise_exception=True)
     serializer.save()
+    counters.track(serializer.Meta.model, 1, recipe=instance.id)
+    membership.add(request.user, serializer.Meta.model, [instance.id])
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@transaction.atomic(savepoint=False)
 def delete_instance(request, name_model, instance, error_message):
     """Удаление из избарнного или в корзины."""
-    if not name_model.objects.filter(user=request.user,
-                                     recipe=instance).exists():
+    deleted, _ = name_model.objects.filter(
+        user=request.user, recipe=instance).delete()
+    if not deleted:
         return Response({'errors': error_message},
                         status=status.HTTP_400_BAD_REQUEST)
-    name_model.objects.filter(user=request.user, recipe=instance).delete()
+    counters.track(name_model, -deleted, recipe=instance.id)
+    membership.remove(request.user, name_model, [instance.id])
     return Response('Рецепт удален', status=status.HTTP_204_NO_CONTENT)
+
+
+def import_recipes(author, items, chunk_size=None, limit=None):
+    """
+    Пакетный импорт рецептов автора из последовательности
+    словарей items. Id тэгов и продуктов загружаются один раз,
+    проверенные рецепты добавляются пачками по chunk_size,
+    каждая в своей транзакции. Ошибки рецепта не прерывают
+    импорт, а ошибка чтения потока завершает его. Вернет
+    id созданных рецептов и ошибки по номерам рецептов.
+    """
+    chunk_size = chunk_size or settings.RECIPE_IMPORT_CHUNK_SIZE
+    context = {
+        'tags': set(Tag.objects.values_list('id', flat=True)),
+        'ingredients': set(Ingredient.objects.values_list(
+            'id', flat=True).iterator()),
+    }
+    created, errors, chunk = [], [], []
+
+    def save_chunk():
+        with transaction.atomic():
+            created.extend(
+                recipe.id for recipe in create_recipes(author, chunk))
+        chunk.clear()
+
+    index = -1
+    try:
+        for index, item in enumerate(items):
+            if limit is not None and index >= limit:
+                errors.append({'index': index, 'errors': {
+                    'non_field_errors': [
+                        f'Не больше {limit} рецептов за запрос.']}})
+                break
+            serializer = RecipeImportSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+                continue
+            chunk.append(serializer.validated_data)
+            if len(chunk) >= chunk_size:
+                save_chunk()
+    except ValueError as error:
+        errors.append({'index': index + 1,
+                       'errors': {'non_field_errors': [str(error)]}})
+    if chunk:
+        save_chunk()
+    return {'created': len(created), 'ids': created, 'errors': errors}
+
+
+def bulk_ids(request):
+    """Id из тела массового запроса {"ids": [...]} без повторов."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def lock_user(user):
+    """
+    Заблокировать строку пользователя до конца транзакции:
+    массовые изменения одного пользователя выполняются по
+    очереди, и параллельные запросы не засчитывают одни
+    и те же связи дважды.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user.pk).values_list('pk', flat=True))
+
+
+def bulk_post_instances(user, model, field, targets, ids, messages,
+                        rejected=None):
+    """
+    Массовое добавление в избранное, корзину или подписки:
+    связи model пользователя с объектами ids поля field.
+    Существующие объекты targets и уже добавленные связи
+    читаются двумя запросами под блокировкой пользователя,
+    новые связи добавляются одним bulk_create.
+    messages - ошибки 'not_found' и 'exists',
+    rejected - заранее отклоненные id с ошибкой.
+    Вызывается в транзакции. Вернет добавленные id и результат
+    по каждому id.
+    """
+    rejected = rejected or {}
+    lock_user(user)
+    found = set(targets.filter(pk__in=ids).values_list('pk', flat=True))
+    existing = set(model.objects.filter(
+        user=user, **{f'{field}__in': found}).values_list(
+            f'{field}_id', flat=True))
+    added = [pk for pk in ids
+             if pk in found and pk not in existing and pk not in rejected]
+    model.objects.bulk_create(
+        (model(user=user, **{f'{field}_id': pk}) for pk in added),
+        ignore_conflicts=True)
+    membership.add(user, model, added)
+    errors = dict(rejected)
+    for pk in ids:
+        if pk not in errors and pk not in added:
+            errors[pk] = messages['exists' if pk in found else 'not_found']
+    return added, bulk_results(ids, errors, 'added')
+
+
+def bulk_delete_instances(user, model, field, ids, error_message):
+    """
+    Массовое удаление связей model пользователя с объектами
+    ids поля field одним DELETE ... IN под блокировкой
+    пользователя. Вызывается в транзакции.
+    Вернет удаленные id и результат по каждому id.
+    """
+    lock_user(user)
+    relations = model.objects.filter(user=user, **{f'{field}__in': ids})
+    removed = set(relations.values_list(f'{field}_id', flat=True))
+    if removed:
+        relations.filter(**{f'{field}__in': removed}).delete()
+        membership.remove(user, model, removed)
+    errors = {pk: error_message for pk in ids if pk not in removed}
+    return [pk for pk in ids if pk in removed], bulk_results(
+        ids, errors, 'removed')
+
+
+def bulk_results(ids, errors, done):
+    return [{'id': pk, 'errors': errors[pk]} if pk in errors
+            else {'id': pk, 'status': done} for pk in ids]
+
+
+def bulk_response(request, changed, results):
+    """Ответ массового запроса: 400, если ничего не изменилось."""
+    if not changed:
+        code = status.HTTP_400_BAD_REQUEST
+    elif request.method == 'POST':
+        code = status.HTTP_201_CREATED
+    else:
+        code = status.HTTP_200_OK
+    return Response({'results': results}, status=code)
+
+
+def make_etag(*parts):
+    """ETag из частей состояния ответа."""
+    return quote_etag(hashlib.md5(
+        ':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def conditional_response(request, build_response, etag):
+    """
+    Ответ 304 Not Modified, если у клиента актуальная версия,
+    иначе ответ build_response(). Сериализация не выполняется,
+    пока версия у клиента совпадает с текущей. Отдается только
+    ETag: Last-Modified точен до секунды и после изменения в ту
+    же секунду дал бы ложный 304. ETag строится по версиям
+    справочников (recipes.versions.get_versions): без общего
+    кеша они читаются из базы и совпадают во всех процессах.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build_response()
+    response['ETag'] = etag
+    return response
@@ -1,44 +1,111 @@
-from api.filter import IngredientFilter, RecipeFilter
+from api.filter import RecipeFilter
+from api import payloads
+from api.pagination import KeysetPagination
+from api.parsers import JSONItemsParser, NDJSONParser, RecipeJSONParser
 from api.permissions import IsAdminAuthorOrReadOnly
+from api.renderers import EXPORT_RENDERERS
 from api.serializers import (BasketSerializer, FavoriteSerializer,
                              IngredientSerializer, RecipeCreateSerializer,
                              RecipeSerializer, SignUpSerializer, TagSerializer,
                              UserFollowGetSerialazer, UserFollowSerializer)
-from api.utils import delete_instance, post_instance
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from api.utils import (bulk_delete_instances, bulk_ids, bulk_post_instances,
+                       bulk_response, conditional_response, delete_instance,
+                       import_recipes, make_etag, post_instance)
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Basket, Favorite, Follow, Ingredient, IngredientIn,
-                            Recipe, Tag)
+from foodgram import replicas
+from recipes import counters, feed, jobs, media, membership, shopping_list
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Basket, Favorite, FeedEntry, Follow, Ingredient,
+                            Recipe, ShoppingListItem, Tag)
+from recipes.versions import get_version, get_versions
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from users.models import User
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет ингредиентов."""
+class ReplicaReadMixin:
+    """
+    Чтение действий replica_actions с реплики базы.
+    Реплика выбирается после аутентификации: токены
+    и пользователи читаются из основной базы, а
+    пользователь, недавно что-то записавший, остается
+    на ней до конца закрепления.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.method in replicas.SAFE_METHODS
+                and self.action in self.replica_actions):
+            replicas.use_replica(request)
+
+
+class IngredientViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Вьюсет ингредиентов.
+    Отвечает из индекса в памяти без обращения к базе:
+    сначала ингредиенты, начинающиеся с name, затем содержащие его.
+    """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [permissions.AllowAny]
-    filter_backends = (DjangoFilterBackend, )
-    filterset_class = IngredientFilter
 
+    def list(self, request):
+        return self.conditional(request, lambda: Response(
+            ingredient_index.search(request.query_params.get('name', ''),
+                                    settings.INGREDIENT_SEARCH_LIMIT)))
+
+    def retrieve(self, request, pk):
+        ingredient = ingredient_index.get(int(pk)) if pk.isdigit() else None
+        if ingredient is None:
+            raise Http404
+        return self.conditional(request, lambda: Response(ingredient))
+
+    def conditional(self, request, build_response):
+        """Ответ 304, если справочник не менялся."""
+        version = get_version('ingredients')
+        return conditional_response(
+            request, build_response,
+            make_etag('ingredients', version,
+                      settings.INGREDIENT_SEARCH_LIMIT))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет тэгов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, super().retrieve, *args, **kwargs)
+
+    def conditional(self, request, handler, *args, **kwargs):
+        """Ответ 304, если теги не менялись."""
+        version = get_version('tags')
+        return conditional_response(
+            request, lambda: handler(request, *args, **kwargs),
+            make_etag('tags', version))
+
 
 class UserView(UserViewSet):
     """Вьюсет юзера."""
     serializer_class = SignUpSerializer
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
         return User.objects.all()
@@ -48,6 +115,7 @@ class FollowView(APIView):
     """Вьюсет создания и удаления подписки."""
     permission_classes = [IsAdminAuthorOrReadOnly]
 
+    @transaction.atomic
     def post(self, request, user_id):
         """Создаем подписку."""
         following = get_object_or_404(User, id=user_id)
@@ -58,41 +126,178 @@ class FollowView(APIView):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        counters.track(Follow, 1, user=request.user.id,
+                       following=following.id)
+        feed.follow(request.user, following)
+        membership.add(request.user, Follow, [following.id])
+        serializer.instance.following.is_subscribed = True
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, user_id):
         """Удаляем подписку."""
         following = get_object_or_404(User, id=user_id)
-        if not Follow.objects.filter(user=request.user,
-                                     following=following).exists():
+        deleted, _ = Follow.objects.filter(user=request.user,
+                                           following=following).delete()
+        if not deleted:
             return Response(
                 {'errors': 'На данного пользователя нет подписки.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Follow.objects.get(user=request.user,
-                           following=following).delete()
+        counters.track(Follow, -deleted, user=request.user.id,
+                       following=following.id)
+        feed.unfollow(request.user, following)
+        membership.remove(request.user, Follow, [following.id])
         return Response('Вы отписались', status=status. HTTP_204_NO_CONTENT)
 
 
-class AllFolowViewSet(mixins.ListModelMixin,
+class BulkFollowView(APIView):
+    """
+    Массовая подписка и отписка: тело {"ids": [id авторов]},
+    в ответе - результат по каждому id. Все изменения
+    выполняются в одной транзакции.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    messages = {'not_found': 'Пользователь не найден.',
+                'exists': 'Вы уже итак подписаны.'}
+
+    @transaction.atomic
+    def post(self, request):
+        """Создаем подписки."""
+        ids = bulk_ids(request)
+        added, results = bulk_post_instances(
+            request.user, Follow, 'following', User.objects.all(), ids,
+            self.messages, rejected={
+                request.user.id: 'Невозможно подписаться на самого себя!'})
+        if added:
+            counters.track(Follow, len(added), user=request.user.id)
+            counters.track(Follow, 1, following=added)
+            feed.follow(request.user, *added)
+        return bulk_response(request, added, results)
+
+    @transaction.atomic
+    def delete(self, request):
+        """Удаляем подписки."""
+        removed, results = bulk_delete_instances(
+            request.user, Follow, 'following', bulk_ids(request),
+            'На данного пользователя нет подписки.')
+        if removed:
+            counters.track(Follow, -len(removed), user=request.user.id)
+            counters.track(Follow, -1, following=removed)
+            feed.unfollow(request.user, *removed)
+        return bulk_response(request, removed, results)
+
+
+class AllFolowViewSet(ReplicaReadMixin, mixins.ListModelMixin,
                       viewsets.GenericViewSet):
-    """Вьюсет всех подписок."""
+    """
+    Вьюсет всех подписок.
+    Рецепты всех авторов страницы выбираются одним запросом
+    с ограничением recipes_limit на каждого автора.
+    """
     serializer_class = UserFollowGetSerialazer
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        limit = self.request.query_params.get('recipes_limit', '')
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(is_subscribed=Value(True)).prefetch_related(Prefetch(
+            'recipes',
+            queryset=Recipe.objects.only(
+                'id', 'name', 'cooking_time', 'image', 'image_variants',
+                'image_status', 'author_id'
+            ).first_per_author(int(limit) if limit.isdigit() else None),
+            to_attr='first_recipes'))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Вьюсет рецептов."""
     queryset = Recipe.objects.all()
+    cached_count_params = ('tags', 'author', 'is_favorited',
+                           'is_in_shopping_cart', 'search')
     permission_classes = [IsAdminAuthorOrReadOnly]
+    parser_classes = [RecipeJSONParser, MultiPartParser]
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        """
+        Результаты поиска упорядочены по релевантности
+        и листаются только по номерам страниц.
+        """
+        if self.request.query_params.get('search'):
+            return None
+        return ('-pub_date', '-id')
+
+    def get_queryset(self):
+        """
+        Для чтения - только поля проверки кешированного
+        представления.
+        """
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            return payloads.page_queryset(queryset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Страница рецептов из кеша представлений."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(payloads.recipe_payloads(list(queryset), request))
+        return self.get_paginated_response(
+            payloads.recipe_payloads(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Рецепт из кеша представлений с поддержкой условного
+        запроса. ETag строится из тех же ключа и строки рецепта,
+        что и проверка кеша: адреса сайта, даты изменения
+        рецепта, данных автора и флагов текущего пользователя.
+        """
+        recipe = None
+        if kwargs['pk'].isdigit():
+            recipe = self.get_queryset().filter(pk=kwargs['pk']).first()
+        if recipe is None:
+            raise Http404
+        self.check_object_permissions(request, recipe)
+        versions = get_versions('tags', 'ingredients')
+        response = conditional_response(
+            request, lambda: self.recipe_response(recipe),
+            make_etag(payloads.payload_key(recipe.id, request),
+                      request.user.pk,
+                      *payloads.stamp(recipe, versions),
+                      *payloads.viewer_flags(
+                          recipe, membership.get(request))))
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def recipe_response(self, recipe):
+        data = payloads.recipe_payloads([recipe], self.request)
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    @transaction.atomic
     def perform_create(self, serializer):
         """Добавляем автора при создании рецепта."""
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        counters.track(Recipe, 1, author=self.request.user.id)
+        feed.add_recipe(recipe)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """
+        Удаляем рецепт, загрузки его изображения, ждущие
+        обработки, и ссылку на файл изображения. Продукты
+        рецепта вычитаются из списков покупок по сигналу.
+        """
+        jobs.cancel(instance)
+        media.release(instance.image.name)
+        instance.delete()
+        counters.track(Recipe, -1, author=instance.author_id)
 
     def get_serializer_class(self):
         """Выбор сериализатора."""
@@ -101,28 +306,135 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             return RecipeCreateSerializer
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        permission_classes=[permissions.IsAuthenticated],
+        parser_classes=[JSONItemsParser, NDJSONParser])
+    def bulk_import(self, request):
+        """
+        Пакетный импорт рецептов текущего пользователя из JSON-массива
+        или JSON Lines. Вернет число и id созданных рецептов и ошибки
+        рецептов с их номерами в запросе.
+        """
+        report = import_recipes(
+            request.user, request.data,
+            limit=settings.RECIPE_IMPORT_MAX_ITEMS)
+        return Response(report, status=(
+            status.HTTP_201_CREATED if report['created']
+            else status.HTTP_400_BAD_REQUEST))
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок от новых к старым.
+        Пользователям с ящиком страница читается из FeedEntry,
+        остальным собирается по подпискам при чтении.
+        """
+        paginator = KeysetPagination()
+        if feed.uses_inbox(request.user):
+            paginator.ordering = ('-pub_date', '-recipe_id')
+            entries = paginator.paginate_queryset(
+                FeedEntry.objects.filter(user=request.user).only(
+                    'pub_date', 'recipe_id'), request)
+            recipes = payloads.page_queryset(Recipe.objects.filter(
+                id__in=[entry.recipe_id for entry in entries]
+            )).order_by('-pub_date', '-id')
+        else:
+            recipes = paginator.paginate_queryset(
+                payloads.page_queryset(Recipe.objects.filter(
+                    author__following__user=request.user
+                )), request)
+        return paginator.get_paginated_response(
+            payloads.recipe_payloads(list(recipes), request))
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=EXPORT_RENDERERS)
     def download_shopping_cart(self, request):
-        """Отправка файла со списком покупок."""
-        ingredients = IngredientIn.objects.filter(
-            recipe__baskets__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(ingredient_amount=Sum('amount'))
-        shopping_list = ['Список покупок:\n']
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['ingredient_amount']
-            shopping_list.append(f'\n{name} - {amount}, {unit}')
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        """
+        Потоковая отправка файла со списком покупок
+        в формате ?format=txt|csv|json|pdf, по умолчанию txt.
+        """
+        renderer = request.accepted_renderer
+        rows = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name').iterator(
+            chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows), content_type=content_type)
         response['Content-Disposition'] = \
-            'attachment; filename="basket.txt"'
+            f'attachment; filename="basket.{renderer.format}"'
         return response
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=[permissions.IsAuthenticated])
+    @transaction.atomic
+    def favorite_many(self, request):
+        """
+        Добавить и удалить в избранное несколько рецептов:
+        тело {"ids": [id рецептов]}, в ответе - результат по id.
+        """
+        ids = bulk_ids(request)
+        if request.method == 'POST':
+            changed, results = bulk_post_instances(
+                request.user, Favorite, 'recipe', Recipe.objects.all(), ids,
+                {'not_found': 'Рецепт не найден.',
+                 'exists': 'Рецепт уже есть в избранном!'})
+            if changed:
+                counters.track(Favorite, 1, recipe=changed)
+        else:
+            changed, results = bulk_delete_instances(
+                request.user, Favorite, 'recipe', ids,
+                'Рецепта нет в избранном!')
+            if changed:
+                counters.track(Favorite, -1, recipe=changed)
+        return bulk_response(request, changed, results)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=[permissions.IsAuthenticated])
+    @transaction.atomic
+    def shopping_cart_many(self, request):
+        """
+        Добавить и удалить в корзину несколько рецептов:
+        тело {"ids": [id рецептов]}, в ответе - результат по id.
+        """
+        ids = bulk_ids(request)
+        with shopping_list.signals_suspended():
+            if request.method == 'POST':
+                changed, results = bulk_post_instances(
+                    request.user, Basket, 'recipe', Recipe.objects.all(),
+                    ids, {'not_found': 'Рецепт не найден.',
+                          'exists': 'Рецепт уже в корзине.'})
+                if changed:
+                    counters.track(Basket, 1, recipe=changed)
+                shopping_list.add_recipes(request.user, changed)
+            else:
+                changed, results = bulk_delete_instances(
+                    request.user, Basket, 'recipe', ids,
+                    'Рецепта нет в корзине!')
+                if changed:
+                    counters.track(Basket, -1, recipe=changed)
+                shopping_list.remove_recipes(request.user, changed)
+        return bulk_response(request, changed, results)
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -141,7 +453,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=["post", "delete"],
         permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, pk):
-        """Добавить и удалить в корзину."""
+        """
+        Добавить и удалить в корзину. Список покупок
+        меняется по сигналам корзины.
+        """
         recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
             return post_instance(request, recipe, BasketSerializer)
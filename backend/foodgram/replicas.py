@@ -0,0 +1,136 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+routing = ContextVar('routing', default=None)
+
+
+class Routing:
+    """
+    Состояние запроса: реплика, с которой читаются данные
+    (None - основная база), и была ли запись.
+    """
+    __slots__ = ('alias', 'written')
+
+    def __init__(self):
+        self.alias = None
+        self.written = False
+
+
+class ReplicaRouter:
+    """
+    Роутер баз данных. Запись всегда идет в основную базу.
+    Чтение идет в реплику, только если ее выбрал для запроса
+    use_replica; после первой записи в запросе чтение
+    возвращается в основную базу. Миграции на реплики
+    не применяются: они получают схему репликацией.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is not None and state.alias is not None:
+            return state.alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.alias = None
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+PIN_COOKIE = 'replica_pin'
+
+
+def pin(response, user_id):
+    """
+    Закрепить пользователя за основной базой на
+    REPLICA_PIN_SECONDS: за это время реплики успевают
+    получить его запись, и он видит ее в следующих запросах.
+    Метка - подписанная cookie с id пользователя: она видна
+    всем процессам и не зависит от кеша Django.
+    """
+    response.set_signed_cookie(
+        PIN_COOKIE, user_id, salt=PIN_COOKIE,
+        max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+        samesite='Lax')
+
+
+def is_pinned(request):
+    """
+    Закреплен ли пользователь запроса. Срок подписи
+    проверяется отдельно: клиент мог сохранить cookie дольше.
+    """
+    user = request.user
+    return user.is_authenticated and request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_COOKIE,
+        max_age=settings.REPLICA_PIN_SECONDS) == str(user.pk)
+
+
+def use_replica(request):
+    """
+    Читать остаток запроса с реплики, если они настроены
+    и пользователь не закреплен за основной базой.
+    """
+    state = routing.get()
+    if (state is None or state.written or not settings.DATABASE_REPLICAS
+            or is_pinned(request)):
+        return
+    state.alias = random.choice(settings.DATABASE_REPLICAS)
+
+
+def reading_replica():
+    state = routing.get()
+    return state is not None and state.alias is not None
+
+
+def cache_timeout(timeout, *versions):
+    """
+    Срок кеширования данных, прочитанных по версиям versions.
+    Реплика может еще не получить изменение, сменившее
+    версию: если данные прочитаны с реплики раньше, чем
+    через REPLICA_PIN_SECONDS после смены, они кешируются
+    не дольше этого срока.
+    """
+    if reading_replica() and time.time() - max(
+            map(float, versions)) < settings.REPLICA_PIN_SECONDS:
+        return min(timeout, settings.REPLICA_PIN_SECONDS)
+    return timeout
+
+
+class ReplicaMiddleware:
+    """
+    Ведет состояние маршрутизации запроса. Пользователь,
+    который что-то записал или отправил изменяющий запрос,
+    закрепляется за основной базой.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = Routing()
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        if state.written or request.method not in SAFE_METHODS:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin(response, user.pk)
+        return response
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from urllib.parse import urlsplit
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -72,6 +74,24 @@ DATABASES = {
     }
 }
 
+DATABASE_REPLICAS = []
+
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    replica = urlsplit(f'//{replica.strip()}')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica.hostname or DATABASES['default']['HOST'],
+        'PORT': replica.port or DATABASES['default']['PORT'],
+        'NAME': replica.path.strip('/') or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,7 +120,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.MyPagination',
 }
@@ -118,6 +138,83 @@ DJOSER = {
     }
 }
 
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.getenv(
+                'CACHE_BACKEND',
+                'django.core.cache.backends.locmem.LocMemCache'),
+            'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        }
+    }
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+RECIPE_IMAGE_VARIANTS = {'card': 400, 'detail': 800, 'retina': 1600}
+
+RECIPE_IMAGE_VARIANTS_DIR = 'recipes/variants/'
+
+RECIPE_IMAGE_UPLOADS_DIR = 'recipes/uploads/'
+
+MEDIA_GC_GRACE = int(os.getenv('MEDIA_GC_GRACE', 3600))
+
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 ** 2))
+
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+
+IMAGE_JOBS_MODE = os.getenv('IMAGE_JOBS_MODE', 'thread')
+
+IMAGE_JOBS_THREADS = int(os.getenv('IMAGE_JOBS_THREADS', 2))
+
+IMAGE_JOBS_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOBS_MAX_ATTEMPTS', 3))
+
+IMAGE_JOBS_RETRY_DELAY = int(os.getenv('IMAGE_JOBS_RETRY_DELAY', 10))
+
+IMAGE_JOBS_LOCK_TIMEOUT = int(os.getenv('IMAGE_JOBS_LOCK_TIMEOUT', 300))
+
+RECIPE_IMPORT_CHUNK_SIZE = int(os.getenv('RECIPE_IMPORT_CHUNK_SIZE', 100))
+
+RECIPE_IMPORT_MAX_ITEMS = int(os.getenv('RECIPE_IMPORT_MAX_ITEMS', 1000))
+
+RECIPE_CACHE_TTL = int(os.getenv('RECIPE_CACHE_TTL', 3600))
+
+MEMBERSHIP_CACHE_BYTES = int(os.getenv('MEMBERSHIP_CACHE_BYTES', 32 * 1024 ** 2))
+
+MEMBERSHIP_TTL = int(os.getenv('MEMBERSHIP_TTL', 300))
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+
+AUTH_TOKEN_SHARED_CACHE = os.getenv('AUTH_TOKEN_SHARED_CACHE', '') == 'True'
+
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 100))
+
+PAGINATION_COUNT_TTL = int(os.getenv('PAGINATION_COUNT_TTL', 300))
+
+PAGINATION_ESTIMATE_MIN = int(os.getenv('PAGINATION_ESTIMATE_MIN', 100000))
+
+FEED_MODE = os.getenv('FEED_MODE', 'auto')
+
+FEED_INBOX_MIN_FOLLOWS = int(os.getenv('FEED_INBOX_MIN_FOLLOWS', 100))
+
+SHOPPING_LIST_CHUNK_SIZE = int(os.getenv('SHOPPING_LIST_CHUNK_SIZE', 500))
+
 STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import (Basket, Favorite, Follow, Ingredient, IngredientIn,
-                     Recipe, Tag, TagRecipe)
+from . import jobs
+from .models import (Basket, Favorite, Follow, ImageJob, Ingredient,
+                     IngredientIn, MediaFile, Recipe, ShoppingListItem, Tag,
+                     TagRecipe)
 
 
 class IngredientInInline(admin.TabularInline):
@@ -49,15 +51,36 @@ class RecipeAdmin(admin.ModelAdmin):
     """
     Настройки отображения модели Recipe в интерфейсе админки.
     """
-    list_display = ('id', 'name', 'author', 'count_in_fav')
+    list_display = ('id', 'name', 'author', 'count_in_fav', 'in_carts_count',
+                    'image_status')
     search_fields = ('name', 'author', 'tags',)
     list_filter = ('name', 'author', 'tags',)
     empty_value_display = '-empty-'
     inlines = (IngredientInInline, TagRecipeInline,)
 
+    def save_model(self, request, obj, form, change):
+        """
+        Новое изображение, как и в API, обрабатывает фоновая
+        задача: она строит варианты и переносит ссылку
+        MediaFile. До ее завершения у рецепта прежнее
+        изображение и состояние pending. Очистить изображение
+        из админки нельзя.
+        """
+        image = None
+        if 'image' in form.changed_data:
+            image = form.cleaned_data.get('image') or None
+            obj.image = form.initial.get('image') or ''
+            if image is not None:
+                obj.image_status = Recipe.IMAGE_PENDING
+        super().save_model(request, obj, form, change)
+        if image is not None:
+            jobs.enqueue(obj, image)
+
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
     def count_in_fav(self, obj):
         """"Счетчик кол-ва добавлений в избранное."""
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
@@ -81,6 +104,17 @@ class BasketAdmin(admin.ModelAdmin):
     empty_value_display = '-empty-'
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """
+    Настройки отображения модели ShoppingListItem в интерфейсе админки.
+    """
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    search_fields = ('user__username',)
+    list_filter = ('user',)
+    empty_value_display = '-empty-'
+
+
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     """
@@ -90,3 +124,26 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ('user',)
     list_filter = ('user',)
     empty_value_display = '-empty-'
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    """
+    Настройки отображения модели ImageJob в интерфейсе админки.
+    """
+    list_display = ('id', 'recipe', 'status', 'attempts', 'run_after',
+                    'error')
+    list_filter = ('status',)
+    raw_id_fields = ('recipe',)
+    empty_value_display = '-empty-'
+
+
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    """
+    Настройки отображения модели MediaFile в интерфейсе админки.
+    """
+    list_display = ('name', 'refs', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'variants', 'refs', 'updated_at')
+    empty_value_display = '-empty-'
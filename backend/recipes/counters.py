@@ -0,0 +1,88 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Basket, Favorite, Follow, Recipe, User
+from .versions import bump_users, bump_version, next_user_version
+
+COUNTERS = {
+    Recipe: {
+        'favorites_count': (Favorite, 'recipe'),
+        'in_carts_count': (Basket, 'recipe'),
+    },
+    User: {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'following'),
+        'following_count': (Follow, 'user'),
+    },
+}
+
+TRACKED = {}
+for model, fields in COUNTERS.items():
+    for field, (relation, related_field) in fields.items():
+        TRACKED.setdefault(relation, []).append(
+            (model, field, related_field))
+
+
+def track(relation, delta, **keys):
+    """
+    Изменить на delta счетчики записей модели relation
+    у объектов keys {поле связи: id или список id}. Счетчики
+    всех объектов поля меняются одним UPDATE с F(), поэтому
+    параллельные запросы не теряют изменений. Вместе со
+    счетчиками меняются и размеры списков, поэтому их кеш
+    сбрасывается, а у пользователей - их кешированные объекты.
+    """
+    if not delta:
+        return
+    bump_version('counts')
+    for model, field, related_field in TRACKED[relation]:
+        if related_field not in keys:
+            continue
+        pks = keys[related_field]
+        if not isinstance(pks, (list, set, tuple)):
+            pks = [pks]
+        changes = {field: Greatest(F(field) + delta, 0)}
+        if model is User:
+            changes['version'] = next_user_version()
+        model.objects.filter(pk__in=pks).update(**changes)
+        if model is User:
+            bump_users(pks, stored=False)
+
+
+def expected_count(relation, related_field):
+    return Coalesce(Subquery(
+        relation.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')).values('total')
+    ), 0)
+
+
+def reconcile(model, pks, check=False):
+    """
+    Сверить счетчики объектов pks с пересчетом по связанным
+    записям и исправить расхождения, если не check.
+    Вернет [(объект, поле, сохранено, ожидается)].
+    """
+    fields = COUNTERS[model]
+    objects = list(model.objects.filter(pk__in=pks).annotate(**{
+        f'expected_{field}': expected_count(*relation)
+        for field, relation in fields.items()
+    }).filter(reduce(or_, (
+        ~Q(**{field: F(f'expected_{field}')}) for field in fields
+    ))).only('pk', *fields).order_by('pk'))
+    mismatches = []
+    for obj in objects:
+        for field in fields:
+            expected = getattr(obj, f'expected_{field}')
+            if getattr(obj, field) != expected:
+                mismatches.append((obj, field, getattr(obj, field), expected))
+                setattr(obj, field, expected)
+    if objects and not check:
+        model.objects.bulk_update(objects, list(fields))
+        if model is User:
+            bump_users([obj.pk for obj in objects])
+    return mismatches
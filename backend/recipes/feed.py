@@ -0,0 +1,121 @@
+from django.conf import settings
+
+from .models import FeedEntry, Follow, Recipe, User
+
+
+def inbox_threshold():
+    """
+    Число подписок, с которого пользователю ведется лента-ящик:
+    0 в режиме push, FEED_INBOX_MIN_FOLLOWS в режиме auto,
+    None в режиме pull, где лента всегда собирается при чтении.
+    """
+    mode = settings.FEED_MODE
+    if mode == 'push':
+        return 0
+    if mode == 'auto':
+        return settings.FEED_INBOX_MIN_FOLLOWS
+    return None
+
+
+def uses_inbox(user):
+    """Читать ли ленту пользователя из ящика."""
+    threshold = inbox_threshold()
+    return threshold is not None and user.following_count >= threshold
+
+
+def entries(recipes):
+    """Записи ленты для строк (подписчик, рецепт, дата рецепта)."""
+    return (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+            for user_id, recipe_id, pub_date in recipes)
+
+
+def add_recipe(recipe):
+    """Рецепт опубликован: разослать его подписчикам с ящиком."""
+    threshold = inbox_threshold()
+    if threshold is None:
+        return
+    followers = Follow.objects.filter(
+        following_id=recipe.author_id, user__following_count__gte=threshold,
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        entries((user_id, recipe.id, recipe.pub_date)
+                for user_id in followers.iterator()),
+        batch_size=1000, ignore_conflicts=True)
+
+
+def add_recipes(recipes):
+    """
+    Опубликованы рецепты одного автора: подписчики читаются
+    один раз, записи всех рецептов добавляются пачками.
+    """
+    threshold = inbox_threshold()
+    if threshold is None or not recipes:
+        return
+    followers = list(Follow.objects.filter(
+        following_id=recipes[0].author_id,
+        user__following_count__gte=threshold,
+    ).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        entries((user_id, recipe.id, recipe.pub_date)
+                for recipe in recipes for user_id in followers),
+        batch_size=1000, ignore_conflicts=True)
+
+
+def follow(user, *authors):
+    """
+    Подписки на authors созданы, счетчик подписок уже изменен.
+    Ящик дополняется рецептами авторов, а если число подписок
+    достигло порога только что, собирается целиком.
+    """
+    threshold = inbox_threshold()
+    count = following_count(user)
+    if threshold is None or count < threshold:
+        return
+    if count - len(authors) < threshold:
+        rebuild([user.id])
+        return
+    FeedEntry.objects.bulk_create(
+        entries((user.id, recipe_id, pub_date)
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author__in=authors).values_list(
+                        'id', 'pub_date').iterator()),
+        batch_size=1000, ignore_conflicts=True)
+
+
+def unfollow(user, *authors):
+    """
+    Подписки на authors удалены, счетчик подписок уже изменен.
+    Из ящика убираются рецепты авторов, а при переходе ниже
+    порога ящик удаляется.
+    """
+    threshold = inbox_threshold()
+    if threshold is None:
+        return
+    count = following_count(user)
+    if count + len(authors) < threshold:
+        return
+    inbox = FeedEntry.objects.filter(user=user)
+    if count >= threshold:
+        inbox = inbox.filter(recipe__author__in=authors)
+    inbox.delete()
+
+
+def following_count(user):
+    return User.objects.filter(pk=user.pk).values_list(
+        'following_count', flat=True).get()
+
+
+def rebuild(user_ids):
+    """Пересобрать ящики пользователей по их подпискам."""
+    threshold = inbox_threshold()
+    FeedEntry.objects.filter(user_id__in=user_ids).delete()
+    if threshold is None:
+        return
+    FeedEntry.objects.bulk_create(
+        entries(Recipe.objects.filter(
+            author__following__user__in=user_ids,
+            author__following__user__following_count__gte=threshold,
+        ).values_list(
+            'author__following__user', 'id', 'pub_date').iterator()),
+        batch_size=5000)
@@ -0,0 +1,232 @@
+import base64
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .storage import recipe_storage
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+SOURCE_FORMATS = {
+    'JPEG': ('jpg', {'quality': 90, 'optimize': True}),
+    'PNG': ('png', {'optimize': True}),
+    'GIF': ('png', {'optimize': True}),
+    'WEBP': ('webp', {'quality': 90}),
+}
+
+
+class InvalidImage(ValueError):
+    """Загрузка не является допустимым изображением."""
+
+
+def flatten(image):
+    """Изображение без прозрачности на белом фоне для JPEG."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+class Base64Decoder:
+    """
+    Потоковое декодирование base64, с заголовком data URI или
+    без него, в файл file. Строка подается частями в feed(),
+    в памяти остается только текущая часть. Тип из заголовка
+    и размер проверяются до декодирования всего изображения.
+    """
+    header_limit = 256
+
+    def __init__(self, file, max_size=None):
+        self.file = file
+        self.max_size = max_size or settings.RECIPE_IMAGE_MAX_SIZE
+        self.size = 0
+        self.pending = b''
+        self.content_type = None
+        self.started = False
+
+    def feed(self, chunk):
+        data = self.pending + chunk
+        if not self.started:
+            if b'data:'.startswith(data[:5]) and b',' not in data:
+                if len(data) > self.header_limit:
+                    raise InvalidImage('Ожидается изображение в base64.')
+                self.pending = data
+                return
+            data = self.read_header(data)
+        data = data.translate(None, b' \t\r\n')
+        usable = len(data) - len(data) % 4
+        self.pending = data[usable:]
+        self.write(data[:usable])
+
+    def read_header(self, data):
+        self.started = True
+        if not data.startswith(b'data:'):
+            return data
+        header, _, data = data.partition(b',')
+        header = header[len(b'data:'):].decode('ascii', 'replace')
+        if not header.endswith(';base64'):
+            raise InvalidImage('Ожидается изображение в base64.')
+        self.content_type = header[:-len(';base64')]
+        image_type = self.content_type.partition('image/')[2].upper()
+        if image_type not in SOURCE_FORMATS:
+            raise InvalidImage(
+                f'Неподдерживаемый тип изображения {self.content_type}.')
+        return data
+
+    def write(self, data):
+        if not data:
+            return
+        try:
+            data = base64.b64decode(data, validate=True)
+        except ValueError:
+            raise InvalidImage('Изображение должно быть в base64.')
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise InvalidImage(
+                f'Изображение больше {self.max_size} байт.')
+        self.file.write(data)
+
+    def close(self):
+        """Декодировать остаток строки. Вернет размер изображения."""
+        if not self.started:
+            self.read_header(self.pending)
+        self.write(self.pending)
+        self.pending = b''
+        if not self.size:
+            raise InvalidImage('Ожидается изображение в base64.')
+        return self.size
+
+
+def check_image(file):
+    """
+    Проверить формат и число пикселей изображения по его
+    заголовку, не декодируя само изображение. Вернет формат.
+    """
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise InvalidImage('Файл поврежден или не является изображением.')
+    finally:
+        file.seek(0)
+    if image_format not in SOURCE_FORMATS:
+        raise InvalidImage(f'Неподдерживаемый формат {image_format}.')
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise InvalidImage(
+            f'Изображение больше {settings.RECIPE_IMAGE_MAX_PIXELS} '
+            f'пикселей.')
+    return image_format
+
+
+def decode_upload(upload, storage=default_storage):
+    """
+    Проверить загруженное изображение и перекодировать его
+    без метаданных. Файл читается с диска, а не копируется
+    в память. Вернет (изображение, расширение, содержимое файла).
+    """
+    with storage.open(upload, 'rb') as file:
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise InvalidImage('Слишком большое изображение.')
+        check_image(file)
+        try:
+            image = Image.open(file)
+            image.verify()
+            file.seek(0)
+            image = Image.open(file)
+            image_format = image.format
+            image = ImageOps.exif_transpose(image)
+            image.load()
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            raise InvalidImage(
+                'Файл поврежден или не является изображением.')
+    extension, options = SOURCE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG' if extension == 'png' else image_format,
+               **options)
+    return image, extension, buffer.getvalue()
+
+
+def make_variants(name, storage=recipe_storage, original=None):
+    """
+    Уменьшенные копии изображения name в WebP и JPEG
+    шириной из RECIPE_IMAGE_VARIANTS. Изображение не
+    увеличивается. Вернет {вариант: {формат: путь, 'width': ширина}}.
+    Уже открытое изображение передается в original.
+    """
+    if original is None:
+        with storage.open(name, 'rb') as file:
+            original = ImageOps.exif_transpose(Image.open(file))
+            original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert(
+            'RGBA' if 'transparency' in original.info
+            or original.mode in ('LA', 'PA') else 'RGB')
+    variants = {}
+    for variant, width in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original
+        if original.width > width:
+            image = original.resize(
+                (width, max(1, round(original.height * width
+                                     / original.width))),
+                Image.Resampling.LANCZOS)
+        variants[variant] = {'width': image.width}
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            (flatten(image) if image_format == 'JPEG' else image).save(
+                buffer, image_format, **options)
+            variants[variant][extension] = storage.save(
+                os.path.join(settings.RECIPE_IMAGE_VARIANTS_DIR,
+                             f'{variant}.{extension}'),
+                ContentFile(buffer.getvalue()))
+    return variants
+
+
+def try_make_variants(name):
+    """
+    make_variants для пула процессов: вернет (name, варианты, None)
+    или (name, None, ошибка), не прерывая обработку остальных.
+    """
+    try:
+        return name, make_variants(name), None
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        return name, None, str(error)
+
+
+def variant_files(variants):
+    return {files[extension] for files in variants.values()
+            for extension in FORMATS if files.get(extension)}
+
+
+def variant_urls(variants, request=None, storage=recipe_storage):
+    """
+    Ссылки на варианты и srcset для каждого формата:
+    ({вариант: {формат: url, 'width': ширина}}, {формат: srcset}).
+    """
+    def url(path):
+        url = storage.url(path)
+        return request.build_absolute_uri(url) if request else url
+
+    urls = {
+        variant: {'width': files['width'],
+                  **{extension: url(files[extension])
+                     for extension in FORMATS}}
+        for variant, files in variants.items()
+    }
+    widths = {files['width']: files for files in urls.values()}
+    srcset = {
+        extension: ', '.join(f'{widths[width][extension]} {width}w'
+                             for width in sorted(widths))
+        for extension in FORMATS
+    } if urls else {}
+    return urls, srcset
@@ -0,0 +1,58 @@
+import json
+
+from . import counters, feed, jobs
+from .models import IngredientIn, Recipe
+
+
+def read_objects(file, chunk_size=65536):
+    """
+    Потоковое чтение JSON-массива объектов или JSON Lines
+    без загрузки всего файла в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[], \t\r\n':
+                position += 1
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+    if buffer[position:].strip(' \t\r\n]'):
+        raise ValueError('Файл JSON обрезан или поврежден.')
+
+
+def create_recipes(author, items):
+    """
+    Добавить рецепты автора пачкой. items - проверенные данные:
+    name, text, cooking_time, tags - список id, ingredients -
+    словарь {id продукта: количество} и необязательный image.
+    Рецепты, продукты и тэги добавляются тремя bulk_create,
+    изображения ставятся в очередь одной вставкой.
+    Вызывается в транзакции. Вернет созданные рецепты.
+    """
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=author, name=item['name'], text=item['text'],
+               cooking_time=item['cooking_time'],
+               image_status=(Recipe.IMAGE_PENDING if item.get('image')
+                             else Recipe.IMAGE_READY))
+        for item in items)
+    IngredientIn.objects.bulk_create(
+        IngredientIn(recipe=recipe, ingredient_id=pk, amount=amount)
+        for recipe, item in zip(recipes, items)
+        for pk, amount in item['ingredients'].items())
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag_id=pk)
+        for recipe, item in zip(recipes, items)
+        for pk in item['tags'])
+    jobs.enqueue_new([(recipe, item['image'])
+                      for recipe, item in zip(recipes, items)
+                      if item.get('image')])
+    counters.track(Recipe, len(recipes), author=author.id)
+    feed.add_recipes(recipes)
+    return recipes
@@ -0,0 +1,109 @@
+import bisect
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Ingredient
+from .versions import get_version
+
+IndexState = namedtuple('IndexState',
+                        'version built keys items by_id grams')
+
+GRAM = 3
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Названия в нижнем регистре хранятся отсортированными,
+    поиск по началу названия идет через bisect. Для поиска
+    внутри названия хранятся позиции названий по каждой
+    их триграмме.
+    Индекс перестраивается, когда меняется версия справочника
+    или истекает INGREDIENT_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = IndexState(None, 0, [], [], {}, {})
+
+    def refresh(self):
+        """Вернет актуальное состояние индекса, перестроив его при нужде."""
+        version = get_version('ingredients')
+        state = self.state
+        if (state.version == version
+                and time.monotonic() - state.built
+                < settings.INGREDIENT_INDEX_TTL):
+            return state
+        with self.lock:
+            if self.state is state:
+                self.state = self.build(version)
+            return self.state
+
+    def build(self, version):
+        """
+        Индекс читается из основной базы: он помечен версией
+        справочника, и отстающая реплика оставила бы в нем
+        старые данные до следующей смены версии.
+        """
+        rows = Ingredient.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'id', 'name', 'measurement_unit').order_by()
+        items = sorted(
+            ({'id': pk, 'name': name, 'measurement_unit': unit}
+             for pk, name, unit in rows.iterator()),
+            key=lambda item: (item['name'].casefold(), item['id']))
+        keys = [item['name'].casefold() for item in items]
+        by_id = {item['id']: item for item in items}
+        grams = {}
+        for position, key in enumerate(keys):
+            for gram in {key[start:start + GRAM]
+                         for start in range(len(key) - GRAM + 1)}:
+                grams.setdefault(gram, array('I')).append(position)
+        return IndexState(version, time.monotonic(), keys, items, by_id,
+                          grams)
+
+    @property
+    def version(self):
+        return self.refresh().version
+
+    def get(self, pk):
+        return self.refresh().by_id.get(pk)
+
+    def search(self, query, limit):
+        """
+        Ингредиенты, название которых начинается с query,
+        а за ними ингредиенты, в названии которых query встречается.
+        Вхождения ищутся только среди названий с самой редкой
+        триграммой query; запрос короче триграммы проверяет
+        названия по порядку до limit совпадений.
+        """
+        state = self.refresh()
+        keys, items = state.keys, state.items
+        query = query.strip().casefold()
+        start = bisect.bisect_left(keys, query)
+        result = []
+        for position in range(start, len(keys)):
+            if len(result) >= limit or not keys[position].startswith(query):
+                break
+            result.append(items[position])
+        if not query or len(result) >= limit:
+            return result
+        candidates = range(len(keys))
+        if len(query) >= GRAM:
+            candidates = min(
+                (state.grams.get(query[start:start + GRAM], ())
+                 for start in range(len(query) - GRAM + 1)), key=len)
+        for position in candidates:
+            key = keys[position]
+            if query in key and not key.startswith(query):
+                result.append(items[position])
+                if len(result) >= limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,234 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import media
+from .images import InvalidImage, decode_upload, make_variants
+from .models import ImageJob, Recipe
+from .storage import recipe_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enqueue(recipe, file):
+    """
+    Сохранить загруженный файл изображения рецепта
+    и поставить задачу его обработки. Прежние задачи рецепта
+    удаляются: их результат уже не нужен. Обработка
+    запускается после фиксации транзакции.
+    """
+    upload = save_upload(file)
+    cancel(recipe)
+    ImageJob.objects.create(recipe=recipe, upload=upload)
+    transaction.on_commit(schedule)
+
+
+def enqueue_new(uploads):
+    """
+    Поставить задачи обработки изображений новых рецептов:
+    uploads - пары (рецепт, файл). Прежних задач у новых
+    рецептов нет, поэтому задачи добавляются одной вставкой.
+    """
+    if not uploads:
+        return
+    ImageJob.objects.bulk_create(
+        ImageJob(recipe=recipe, upload=save_upload(file))
+        for recipe, file in uploads)
+    transaction.on_commit(schedule)
+
+
+def save_upload(file):
+    """Сохранить загруженный файл в каталог очереди."""
+    upload = default_storage.save(
+        os.path.join(settings.RECIPE_IMAGE_UPLOADS_DIR,
+                     f'{uuid.uuid4().hex}.upload'),
+        file)
+    file.close()
+    return upload
+
+
+def cancel(recipe):
+    """
+    Удалить задачи рецепта. Их загрузки удаляются
+    после фиксации транзакции.
+    """
+    jobs = ImageJob.objects.filter(recipe=recipe)
+    uploads = list(jobs.values_list('upload', flat=True))
+    if uploads:
+        jobs.delete()
+        transaction.on_commit(lambda: remove(*uploads))
+
+
+def remove(*names):
+    """Удалить файлы, не прерываясь на ошибках хранилища."""
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Не удалось удалить %s', name, exc_info=True)
+
+
+def schedule():
+    """
+    Запустить обработку очереди в потоке этого процесса
+    в режиме IMAGE_JOBS_MODE = 'thread'. В режиме 'worker'
+    очередь разбирает команда process_image_jobs.
+    """
+    global _executor
+    if settings.IMAGE_JOBS_MODE != 'thread':
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.IMAGE_JOBS_THREADS,
+                thread_name_prefix='image-jobs')
+    _executor.submit(drain)
+
+
+def drain():
+    """
+    Выполнять задачи, пока в очереди есть ожидающие, в том
+    числе отложенные повторы, и закрыть соединение.
+    """
+    try:
+        while True:
+            if work_once():
+                continue
+            run_after = ImageJob.objects.filter(
+                status=ImageJob.PENDING).order_by('run_after').values_list(
+                    'run_after', flat=True).first()
+            if run_after is None:
+                break
+            time.sleep(max((run_after - timezone.now()).total_seconds(), 0))
+    except Exception:
+        logger.exception('Ошибка очереди обработки изображений')
+    finally:
+        connection.close()
+
+
+def work_once():
+    """Взять и выполнить одну задачу. Вернет False, если задач нет."""
+    job = claim()
+    if job is None:
+        return False
+    run(job)
+    return True
+
+
+def claim():
+    """
+    Взять задачу из очереди: ожидающую или выполняемую
+    с истекшей блокировкой. Задача забирается условным
+    UPDATE по числу попыток, поэтому одну задачу не возьмут
+    два обработчика; в PostgreSQL занятые строки пропускаются.
+    """
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = ImageJob.objects.select_for_update(skip_locked=True).filter(
+                status__in=(ImageJob.PENDING, ImageJob.RUNNING),
+                run_after__lte=now,
+            ).order_by('run_after', 'id').first()
+            if job is None:
+                return None
+            run_after = now + timedelta(
+                seconds=settings.IMAGE_JOBS_LOCK_TIMEOUT)
+            claimed = ImageJob.objects.filter(
+                pk=job.pk, attempts=job.attempts,
+            ).update(status=ImageJob.RUNNING, attempts=F('attempts') + 1,
+                     run_after=run_after)
+        if claimed:
+            job.status = ImageJob.RUNNING
+            job.attempts += 1
+            job.run_after = run_after
+            return job
+
+
+def owned(job):
+    """Задачу не отменили и не забрал другой обработчик."""
+    return ImageJob.objects.select_for_update().filter(
+        pk=job.pk, attempts=job.attempts).exists()
+
+
+def run(job):
+    """
+    Выполнить задачу: декодировать и проверить загрузку,
+    сохранить перекодированное изображение и его варианты
+    и записать их рецепту. Неверное изображение отмечается
+    ошибкой сразу, прочие ошибки повторяются с паузой.
+    Уже сохраненное изображение повторно не обрабатывается.
+    """
+    try:
+        image, extension, content = decode_upload(job.upload)
+        name = recipe_storage.save(
+            Recipe._meta.get_field('image').generate_filename(
+                None, f'image.{extension}'),
+            ContentFile(content))
+        variants = (media.stored_variants(name)
+                    or make_variants(name, original=image))
+        finish(job, name, variants)
+    except InvalidImage as error:
+        fail(job, str(error))
+        return
+    except Exception as error:
+        logger.exception('Не удалось обработать %s', job.upload)
+        if job.attempts >= settings.IMAGE_JOBS_MAX_ATTEMPTS:
+            fail(job, str(error))
+        else:
+            retry(job, str(error))
+        return
+    remove(job.upload)
+
+
+def finish(job, name, variants):
+    """
+    Записать рецепту обработанное изображение, перенести
+    ссылку с прежнего изображения и удалить задачу.
+    Если задачу отменили, рецепт не меняется.
+    """
+    with transaction.atomic():
+        if not owned(job):
+            return
+        old_image = Recipe.objects.filter(pk=job.recipe_id).values_list(
+            'image', flat=True).get()
+        Recipe.objects.filter(pk=job.recipe_id).update(
+            image=name, image_variants=variants,
+            image_status=Recipe.IMAGE_READY, updated_at=timezone.now())
+        media.acquire(name, variants)
+        media.release(old_image)
+        ImageJob.objects.filter(pk=job.pk).delete()
+
+
+def fail(job, error):
+    """Отметить задачу и изображение рецепта ошибкой."""
+    with transaction.atomic():
+        if not owned(job):
+            return
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.FAILED, error=error)
+        Recipe.objects.filter(pk=job.recipe_id).update(
+            image_status=Recipe.IMAGE_FAILED, updated_at=timezone.now())
+    remove(job.upload)
+
+
+def retry(job, error):
+    """Вернуть задачу в очередь с паузой, растущей с каждой попыткой."""
+    ImageJob.objects.filter(pk=job.pk, attempts=job.attempts).update(
+        status=ImageJob.PENDING, error=error,
+        run_after=timezone.now() + timedelta(
+            seconds=settings.IMAGE_JOBS_RETRY_DELAY
+            * 2 ** (job.attempts - 1)))
@@ -0,0 +1,66 @@
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.images import try_make_variants
+from recipes.models import MediaFile, Recipe
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды построения вариантов изображений
+    для уже загруженных рецептов. Изображения обрабатываются
+    в пуле процессов, результат пишется пачками. Процессы
+    запускаются заново (spawn) и не наследуют соединения с базой.
+    python manage.py build_image_variants [--workers N] [--force]
+    """
+    help = 'Построение уменьшенных вариантов изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов обработки.')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересобрать и уже построенные варианты.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Число изображений в пачке.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.filter(image_variants={})
+        names = recipes.order_by('image').values_list(
+            'image', flat=True).distinct().iterator()
+        done = failed = 0
+        with ProcessPoolExecutor(
+                options['workers'], initializer=django.setup,
+                mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                batch = list(itertools.islice(names, options['batch_size']))
+                if not batch:
+                    break
+                for name, variants, error in pool.map(
+                        try_make_variants, batch):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'{name}: {error}')
+                        continue
+                    self.save(name, variants)
+                    done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, с ошибкой: {failed}.'))
+
+    def save(self, name, variants):
+        """
+        Записать варианты всем рецептам с изображением name.
+        Прежние файлы вариантов удалит команда collect_media.
+        """
+        Recipe.objects.filter(image=name).update(
+            image_variants=variants, updated_at=timezone.now())
+        MediaFile.objects.filter(name=name).update(variants=variants)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import media
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды сборки мусора в хранилище изображений.
+    Пересчитывает ссылки рецептов на файлы, удаляет файлы без
+    ссылок и файлы, о которых не знает база. Файлы моложе
+    --grace секунд не удаляются: их может использовать
+    выполняемая сейчас обработка. Запускается по расписанию.
+    python manage.py collect_media [--grace SEC] [--dry-run]
+    """
+    help = 'Удаление неиспользуемых файлов изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не удалять файлы моложе стольких секунд.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        fixed = media.reconcile()
+        deleted, removed = media.collect(
+            options['grace'], options['dry_run'])
+        for name in removed:
+            self.stdout.write(name)
+        verb = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено ссылок: {fixed}. {verb} записей: {deleted}, '
+            f'файлов: {len(removed)}.'))
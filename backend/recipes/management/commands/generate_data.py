@@ -0,0 +1,300 @@
+import bisect
+import csv
+import io
+import itertools
+import json
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+from recipes import media
+from recipes.models import (Basket, Favorite, Follow, Ingredient, IngredientIn,
+                            MediaFile, Recipe, Tag, TagRecipe)
+from users.models import User
+
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+
+
+class Popularity:
+    """
+    Выбор объектов с вероятностью по закону Ципфа:
+    объект ранга r выбирается с весом 1 / r ** skew.
+    Ранги раздаются объектам в случайном порядке.
+    """
+
+    def __init__(self, ids, skew, rnd):
+        self.ids = list(ids)
+        rnd.shuffle(self.ids)
+        self.random = rnd
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** skew for rank in range(1, len(self.ids) + 1)))
+
+    def choice(self):
+        point = self.random.random() * self.cum_weights[-1]
+        return self.ids[bisect.bisect(self.cum_weights, point)]
+
+    def sample(self, count, exclude=None):
+        """Выбор count различных объектов без exclude."""
+        count = min(count, len(self.ids) // 2)
+        chosen = set()
+        for _ in range(count * 10):
+            if len(chosen) >= count:
+                break
+            item = self.choice()
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class BulkCreateWriter:
+    """Запись строк пачками через bulk_create."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def write(self, model, objects):
+        with explicit_dates(model):
+            for batch in batches(objects, self.batch_size):
+                model.objects.bulk_create(batch)
+
+
+class CopyWriter:
+    """Запись строк пачками через COPY в PostgreSQL."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def write(self, model, objects):
+        fields = [field for field in model._meta.concrete_fields
+                  if not isinstance(field, models.AutoField)
+                  or model in (User, Recipe)]
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields)
+        sql = (f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+               f"({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')")
+        with connection.cursor() as cursor:
+            for batch in batches(objects, self.batch_size):
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for obj in batch:
+                    writer.writerow(
+                        self.value(obj, field) for field in fields)
+                buffer.seek(0)
+                cursor.cursor.copy_expert(sql, buffer)
+
+    def value(self, obj, field):
+        value = getattr(obj, field.attname)
+        if value is None and (getattr(field, 'auto_now', False)
+                              or getattr(field, 'auto_now_add', False)):
+            value = field.pre_save(obj, add=True)
+        if isinstance(field, models.JSONField):
+            return json.dumps(value)
+        value = field.get_db_prep_save(value, connection)
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        return value
+
+
+@contextmanager
+def explicit_dates(model):
+    """
+    Отключает auto_now_add, чтобы bulk_create
+    сохранял заданные генератором даты.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды генерации синтетических данных
+    для нагрузочного тестирования.
+    Авторы рецептов и рецепты в избранном и корзинах выбираются
+    по закону Ципфа, число избранного, покупок и подписок
+    на пользователя распределено по Парето.
+    python manage.py generate_data --users 100000 --recipes 1000000
+    """
+    help = 'Генерация синтетических данных для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Число пользователей.')
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Число рецептов.')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Среднее число ингредиентов в рецепте.')
+        parser.add_argument('--tags', type=int, default=2,
+                            help='Наибольшее число тегов рецепта.')
+        parser.add_argument('--favorites', type=float, default=20,
+                            help='Среднее число избранного у пользователя.')
+        parser.add_argument('--carts', type=float, default=3,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--follows', type=float, default=10,
+                            help='Среднее число подписок у пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель закона Ципфа для популярности '
+                                 'авторов и рецептов.')
+        parser.add_argument('--tail', type=float, default=1.5,
+                            help='Показатель Парето для активности '
+                                 'пользователей (меньше - тяжелее хвост).')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить рецепты.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел.')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Размер пачки записи.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.options = options
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            raise CommandError(
+                'В базе нет ингредиентов, выполните load_import.')
+        writer_class = (CopyWriter if connection.vendor == 'postgresql'
+                        else BulkCreateWriter)
+        self.writer = writer_class(options['batch_size'])
+        with transaction.atomic():
+            tags = self.get_tags()
+            users = self.generate_users()
+            recipes = self.generate_recipes(users, ingredients, tags)
+            self.generate_choices(users, recipes)
+            self.generate_follows(users)
+            call_command('rebuild_shopping_lists', users=list(users),
+                         stdout=self.stdout)
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_feeds', stdout=self.stdout)
+            media.reconcile()
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [User, Recipe]):
+                    cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}.'))
+
+    def activity(self, mean):
+        """Число объектов у пользователя со средним mean."""
+        alpha = self.options['tail']
+        return int(mean * (alpha - 1) / alpha
+                   * self.random.paretovariate(alpha))
+
+    def write(self, model, objects):
+        self.stdout.write(f'{model._meta.verbose_name_plural}...')
+        self.writer.write(model, objects)
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in DEFAULT_TAGS)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(
+            max_id=models.Max('id'))['max_id'] or 0) + 1
+
+    def generate_users(self):
+        first_id = self.next_id(User)
+        ids = range(first_id, first_id + self.options['users'])
+        password = make_password('foodgram-load')
+        joined = timezone.now() - timedelta(days=self.options['days'])
+        self.write(User, (
+            User(id=pk, username=f'user{pk}', email=f'user{pk}@foodgram.ru',
+                 first_name='Имя', last_name='Фамилия', password=password,
+                 date_joined=joined)
+            for pk in ids))
+        return ids
+
+    def generate_recipes(self, users, ingredients, tags):
+        rnd = self.random
+        first_id = self.next_id(Recipe)
+        ids = range(first_id, first_id + self.options['recipes'])
+        authors = Popularity(users, self.options['skew'], rnd)
+        images = self.get_images()
+        now = timezone.now()
+        seconds = self.options['days'] * 24 * 3600
+        self.write(Recipe, (
+            Recipe(id=pk, name=f'Рецепт {pk}', text='Описание рецепта',
+                   cooking_time=rnd.randint(5, 180),
+                   image=image, image_variants=variants,
+                   author_id=authors.choice(),
+                   pub_date=now - timedelta(seconds=rnd.randrange(seconds)))
+            for pk, (image, variants) in (
+                (pk, rnd.choice(images)) for pk in ids)))
+        per_recipe = self.options['ingredients']
+        self.write(IngredientIn, (
+            IngredientIn(recipe_id=pk, ingredient_id=ingredient,
+                         amount=rnd.randint(1, 1000))
+            for pk in ids
+            for ingredient in rnd.sample(
+                ingredients,
+                min(max(1, int(rnd.gauss(per_recipe, per_recipe / 3))),
+                    len(ingredients)))))
+        for model in (Recipe.tags.through, TagRecipe):
+            self.write(model, (
+                model(recipe_id=pk, tag_id=tag)
+                for pk, tag in self.recipe_tags(ids, tags)))
+        return ids
+
+    def recipe_tags(self, recipes, tags):
+        """
+        Пары рецепт-тег. Генератор с собственным зерном дает
+        одинаковые пары для Recipe.tags и TagRecipe без хранения в памяти.
+        """
+        rnd = random.Random(self.options['seed'])
+        limit = min(self.options['tags'], len(tags))
+        for pk in recipes:
+            for tag in rnd.sample(tags, rnd.randint(1, limit)):
+                yield pk, tag
+
+    def get_images(self):
+        """Уже загруженные картинки рецептов с их вариантами."""
+        return list(MediaFile.objects.order_by('name').values_list(
+            'name', 'variants')) or [('', {})]
+
+    def generate_choices(self, users, recipes):
+        popular = Popularity(recipes, self.options['skew'], self.random)
+        for model, mean in ((Favorite, self.options['favorites']),
+                            (Basket, self.options['carts'])):
+            self.write(model, (
+                model(user_id=user, recipe_id=recipe)
+                for user in users
+                for recipe in popular.sample(self.activity(mean))))
+
+    def generate_follows(self, users):
+        authors = Popularity(users, self.options['skew'], self.random)
+        now = timezone.now()
+        self.write(Follow, (
+            Follow(user_id=user, following_id=author, created=now)
+            for user in users
+            for author in authors.sample(
+                self.activity(self.options['follows']), exclude=user)))
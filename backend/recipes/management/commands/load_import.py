@@ -1,24 +1,154 @@
 import csv
+import itertools
 import os
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.importer import read_objects
 from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+JSON_FORMATS = ('json', 'ndjson', 'jsonl')
+
+
+def read_csv(file):
+    """
+    Строки CSV-файла без заголовка: номер строки, название,
+    единица измерения (None в неполной строке).
+    """
+    reader = csv.reader(file, delimiter=',')
+    for row in reader:
+        if row:
+            yield reader.line_num, row[0], row[1] if len(row) > 1 else None
+
+
+def read_json(file):
+    """
+    Объекты JSON-массива или JSON Lines: номер объекта,
+    название, единица измерения (None, если их нет).
+    """
+    try:
+        for number, item in enumerate(read_objects(file), 1):
+            if not isinstance(item, dict):
+                item = {}
+            yield number, item.get('name'), item.get('measurement_unit')
+    except ValueError as error:
+        raise CommandError(str(error))
+
+
+def ingredient_key(name, unit):
+    """
+    Ключ ингредиента без пробелов по краям, одинаковый для
+    файла и базы. None, если название или единица пусты.
+    """
+    if not isinstance(name, str) or not isinstance(unit, str):
+        return None
+    key = (name.strip(), unit.strip())
+    return key if all(key) else None
 
 
 class Command(BaseCommand):
     """
     Класс настройки команды для импорта в базу из файла.
-    python manage.py load_import
+    Файл читается потоково, повторы убираются в памяти,
+    новые ингредиенты добавляются пачками в одной транзакции.
+    python manage.py load_import [путь] [--dry-run]
     """
     help = 'Импорт из файла в базу данных.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data/ingredients.csv'),
+            help='Путь к файлу CSV, JSON или JSON Lines.')
+        parser.add_argument(
+            '--format', choices=('csv',) + JSON_FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Размер пачки добавления.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать отличия файла от базы без записи.')
+
     def handle(self, *args, **options):
-        with open(os.path.join(settings.BASE_DIR, 'data/ingredients.csv'),
-                  'rt', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            for row in csv_reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in ('csv',) + JSON_FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        reader = read_csv if file_format == 'csv' else read_json
+        existing = {
+            ingredient_key(name, unit) for name, unit
+            in Ingredient.objects.values_list(
+                'name', 'measurement_unit').iterator()}
+        existing.discard(None)
+        with open(path, 'rt', encoding='utf-8') as file:
+            stats = self.import_rows(
+                reader(file), existing, options['chunk_size'],
+                options['dry_run'])
+        self.report(stats, len(existing), options['dry_run'])
+
+    def import_rows(self, rows, existing, chunk_size, dry_run):
+        """Добавление новых ингредиентов пачками."""
+        stats = {'read': 0, 'repeated': 0, 'existing': 0, 'new': [],
+                 'malformed': []}
+        seen = set()
+        new_rows = self.new_rows(rows, existing, seen, stats)
+        with transaction.atomic():
+            while True:
+                chunk = list(itertools.islice(new_rows, chunk_size))
+                if not chunk:
+                    break
+                stats['new'].extend(chunk[:max(0, 20 - len(stats['new']))])
+                stats['created'] = stats.get('created', 0) + len(chunk)
+                if not dry_run:
+                    Ingredient.objects.bulk_create(
+                        (Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in chunk),
+                        batch_size=chunk_size, ignore_conflicts=True)
+            if stats.get('created') and not dry_run:
+                transaction.on_commit(
+                    lambda: bump_version('ingredients'))
+        stats['in_file'] = len(seen)
+        return stats
+
+    def new_rows(self, rows, existing, seen, stats):
+        for number, name, unit in rows:
+            stats['read'] += 1
+            key = ingredient_key(name, unit)
+            if key is None:
+                stats['malformed'].append(number)
+                continue
+            if key in seen:
+                stats['repeated'] += 1
+                continue
+            seen.add(key)
+            if key in existing:
+                stats['existing'] += 1
+                continue
+            yield key
+
+    def report(self, stats, in_db, dry_run):
+        created = stats.get('created', 0)
+        self.stdout.write(
+            f'Прочитано строк: {stats["read"]}, '
+            f'повторов в файле: {stats["repeated"]}, '
+            f'уже в базе: {stats["existing"]}, '
+            f'новых: {created}, '
+            f'только в базе: {in_db - stats["existing"]}.')
+        malformed = stats['malformed']
+        if malformed:
+            self.stderr.write(self.style.WARNING(
+                f'Пропущено неполных строк: {len(malformed)} ('
+                + ', '.join(map(str, malformed[:20]))
+                + (', ...' if len(malformed) > 20 else '') + ').'))
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Добавлено ингредиентов: {created}.'))
+            return
+        for name, unit in stats['new']:
+            self.stdout.write(f'+ {name}, {unit}')
+        if created > len(stats['new']):
+            self.stdout.write(f'... и еще {created - len(stats["new"])}')
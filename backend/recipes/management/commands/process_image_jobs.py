@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes import jobs
+from recipes.models import ImageJob
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды обработчика очереди изображений.
+    Берет задачи ImageJob по одной и ждет новые, пока не
+    будет остановлен. Обработчиков можно запустить несколько.
+    python manage.py process_image_jobs [--once] [--interval SEC]
+    """
+    help = 'Фоновая обработка загруженных изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.')
+
+    def handle(self, *args, **options):
+        done = 0
+        try:
+            while True:
+                if jobs.work_once():
+                    done += 1
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        failed = ImageJob.objects.filter(status=ImageJob.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, с ошибкой в очереди: {failed}.'))
@@ -0,0 +1,50 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes import feed
+from recipes.models import FeedEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды пересборки лент-ящиков.
+    Нужна после смены FEED_MODE или FEED_INBOX_MIN_FOLLOWS
+    и после массовой загрузки подписок и рецептов.
+    python manage.py rebuild_feeds [--user ID ...]
+    """
+    help = 'Пересборка лент рецептов из подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='users',
+            help='id пользователей, по умолчанию все.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Число пользователей в пачке.')
+
+    def handle(self, *args, **options):
+        if options['users']:
+            user_ids = iter(sorted(options['users']))
+        else:
+            threshold = feed.inbox_threshold()
+            inbox_users = set(FeedEntry.objects.values_list(
+                'user_id', flat=True).order_by().distinct())
+            if threshold is not None:
+                inbox_users |= set(User.objects.filter(
+                    following_count__gte=threshold,
+                    following_count__gt=0,
+                ).values_list('id', flat=True))
+            user_ids = iter(sorted(inbox_users))
+        rebuilt = 0
+        while True:
+            batch = list(itertools.islice(user_ids, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                feed.rebuild(batch)
+            rebuilt += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {rebuilt}, '
+            f'записей: {FeedEntry.objects.count()}.'))
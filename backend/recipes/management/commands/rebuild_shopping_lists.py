@@ -0,0 +1,64 @@
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes import shopping_list
+from recipes.models import Basket, ShoppingListItem
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды проверки и пересборки списков покупок.
+    Пользователи обрабатываются пачками, каждая пачка
+    пересобирается в своей транзакции.
+    python manage.py rebuild_shopping_lists [--check] [--user ID ...]
+    """
+    help = 'Проверка и пересборка списков покупок по корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только найти расхождения, ничего не меняя.')
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='users',
+            help='id пользователей, по умолчанию все.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Число пользователей в пачке.')
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for user_ids in self.batches(options):
+            if options['check']:
+                mismatches = shopping_list.find_mismatches(user_ids)
+                for user_id, ingredient_id, expected, stored in mismatches:
+                    self.stdout.write(
+                        f'юзер {user_id}, ингредиент {ingredient_id}: '
+                        f'ожидается {expected}, сохранено {stored}')
+                mismatched += len(mismatches)
+                continue
+            with transaction.atomic():
+                shopping_list.rebuild(user_ids)
+        if not options['check']:
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок пересобраны.'))
+        elif mismatched:
+            raise CommandError(f'Найдено расхождений: {mismatched}.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+
+    def batches(self, options):
+        """id пользователей с корзиной или списком покупок пачками."""
+        if options['users']:
+            user_ids = iter(sorted(options['users']))
+        else:
+            user_ids = iter(sorted(
+                set(Basket.objects.values_list(
+                    'user_id', flat=True).order_by().distinct())
+                | set(ShoppingListItem.objects.values_list(
+                    'user_id', flat=True).order_by().distinct())))
+        while True:
+            batch = list(itertools.islice(user_ids, options['batch_size']))
+            if not batch:
+                return
+            yield batch
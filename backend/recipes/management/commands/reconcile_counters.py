@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes import counters
+from recipes.models import Recipe
+from users.models import User
+
+MODELS = {'recipes': Recipe, 'users': User}
+
+
+class Command(BaseCommand):
+    """
+    Класс настройки команды сверки счетчиков рецептов и пользователей.
+    Объекты обходятся пачками по возрастанию id, расхождения
+    каждой пачки исправляются в своей транзакции.
+    python manage.py reconcile_counters [--check] [--model recipes]
+    """
+    help = 'Сверка и исправление хранимых счетчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только найти расхождения, ничего не меняя.')
+        parser.add_argument(
+            '--model', choices=MODELS, nargs='+', dest='models',
+            default=list(MODELS), help='Какие счетчики сверять.')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Число объектов в пачке.')
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for name in options['models']:
+            model = MODELS[name]
+            for pks in self.batches(model, options['batch_size']):
+                with transaction.atomic():
+                    mismatches = counters.reconcile(
+                        model, pks, check=options['check'])
+                for obj, field, stored, expected in mismatches:
+                    self.stdout.write(
+                        f'{name} {obj.pk}, {field}: '
+                        f'сохранено {stored}, ожидается {expected}')
+                mismatched += len(mismatches)
+        if options['check'] and mismatched:
+            raise CommandError(f'Найдено расхождений: {mismatched}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено расхождений: {mismatched}.'
+            if mismatched else 'Расхождений нет.'))
+
+    def batches(self, model, batch_size):
+        """id объектов пачками по возрастанию."""
+        last = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            yield pks
+            last = pks[-1]
@@ -0,0 +1,122 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .images import variant_files
+from .models import ImageJob, MediaFile, Recipe
+from .storage import recipe_storage
+
+
+def stored_variants(name):
+    """
+    Уже построенные варианты изображения name или None.
+    Одинаковое изображение второй раз не обрабатывается.
+    """
+    variants = MediaFile.objects.filter(name=name).values_list(
+        'variants', flat=True).first()
+    if variants and all(recipe_storage.exists(path)
+                        for path in variant_files(variants)):
+        return variants
+    return None
+
+
+def acquire(name, variants):
+    """
+    Рецепт стал использовать изображение name. Если collect
+    удалил запись между вставкой и изменением, она
+    создается заново со ссылкой.
+    """
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, variants=variants)], ignore_conflicts=True)
+    if not MediaFile.objects.filter(name=name).update(
+            refs=F('refs') + 1, variants=variants,
+            updated_at=timezone.now()):
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name, variants=variants, refs=1)],
+            ignore_conflicts=True)
+
+
+def release(name):
+    """Рецепт перестал использовать изображение name."""
+    if name:
+        MediaFile.objects.filter(name=name, refs__gt=0).update(
+            refs=F('refs') - 1, updated_at=timezone.now())
+
+
+def reconcile():
+    """
+    Пересчитать ссылки по рецептам: счетчик мог разойтись,
+    например, при каскадном удалении рецептов с автором.
+    Вернет число исправленных файлов.
+    """
+    known = set(MediaFile.objects.values_list('name', flat=True))
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=name) for name in Recipe.objects.exclude(
+            image='').order_by().values_list(
+                'image', flat=True).distinct().iterator()
+         if name not in known),
+        batch_size=1000, ignore_conflicts=True)
+    expected = Coalesce(Subquery(
+        Recipe.objects.filter(image=OuterRef('name')).order_by().values(
+            'image').annotate(total=Count('pk')).values('total')), 0)
+    return MediaFile.objects.annotate(expected=expected).exclude(
+        refs=F('expected')).update(refs=expected, updated_at=timezone.now())
+
+
+def walk(storage, path):
+    """Все файлы каталога path хранилища с подкаталогами."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from walk(storage, os.path.join(path, directory))
+
+
+def collect(grace=None, dry_run=False):
+    """
+    Удалить файлы изображений без ссылок старше grace секунд
+    и файлы каталога рецептов, которых нет в MediaFile,
+    в вариантах и в очереди обработки. Вернет
+    (удалено записей, список удаленных файлов).
+    Используемые файлы собираются до удаления записей:
+    обработчик мог взять варианты записи, пока она еще была,
+    и сослаться на них после удаления. Поэтому файлы
+    удаленных записей удаляет следующий запуск, а записи
+    удаляются под блокировкой с повторной проверкой ссылок.
+    """
+    if grace is None:
+        grace = settings.MEDIA_GC_GRACE
+    threshold = timezone.now() - timedelta(seconds=grace)
+    live = set(ImageJob.objects.values_list('upload', flat=True))
+    for name, variants in MediaFile.objects.values_list(
+            'name', 'variants').iterator():
+        live.add(name)
+        live.update(variant_files(variants))
+    for name, variants in Recipe.objects.exclude(image='').values_list(
+            'image', 'image_variants').iterator():
+        live.add(name)
+        live.update(variant_files(variants))
+    with transaction.atomic():
+        unused = list(MediaFile.objects.select_for_update().filter(
+            refs=0, updated_at__lt=threshold).values_list('pk', flat=True))
+        deleted = len(unused)
+        if unused and not dry_run:
+            deleted = MediaFile.objects.filter(
+                pk__in=unused, refs=0).delete()[0]
+    root = Recipe._meta.get_field('image').upload_to
+    removed = []
+    for name in walk(recipe_storage, root):
+        if name in live or recipe_storage.get_modified_time(
+                name) >= threshold:
+            continue
+        if not dry_run:
+            recipe_storage.delete(name)
+        removed.append(name)
+    return deleted, removed
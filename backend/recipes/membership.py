@@ -0,0 +1,192 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Basket, Favorite, Follow
+from .versions import bump_users, shared_cache
+
+KINDS = {
+    Favorite: ('favorites', 'recipe_id'),
+    Basket: ('cart', 'recipe_id'),
+    Follow: ('follows', 'following_id'),
+}
+
+
+class Membership:
+    """
+    Id рецептов в избранном и в корзине пользователя
+    и id авторов, на которых он подписан.
+    """
+    __slots__ = ('favorites', 'cart', 'follows')
+
+    def __init__(self, favorites=(), cart=(), follows=()):
+        self.favorites = set(favorites)
+        self.cart = set(cart)
+        self.follows = set(follows)
+
+    def size(self):
+        """Примерный объем в памяти, байт."""
+        sets = (self.favorites, self.cart, self.follows)
+        return (sum(map(sys.getsizeof, sets))
+                + 32 * sum(map(len, sets)))
+
+
+EMPTY = Membership()
+
+
+class Entry:
+    __slots__ = ('version', 'loaded', 'membership', 'size')
+
+    def __init__(self, version, membership):
+        self.version = version
+        self.loaded = time.monotonic()
+        self.membership = membership
+        self.size = membership.size()
+
+
+class MembershipStore:
+    """
+    Множества избранного, корзины и подписок пользователей
+    в памяти процесса. Актуальность записи проверяется по
+    версии пользователя в кеше Django: запись через API
+    увеличивает версию после фиксации транзакции, процесс,
+    выполнивший запись, меняет свою запись на месте, остальные
+    перечитывают множества. Записи старше MEMBERSHIP_TTL тоже
+    перечитываются: так видны изменения в обход API. При
+    превышении MEMBERSHIP_CACHE_BYTES вытесняются записи
+    давно не обращавшихся пользователей (LRU).
+    Без общего кеша Django версии в нем не видны другим
+    процессам, и версией служит User.version, прочитанная
+    при аутентификации: запись через API увеличивает ее
+    в своей транзакции, а процесс, выполнивший запись,
+    перечитывает множества.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, user):
+        """Множества пользователя, загружаются тремя запросами."""
+        if not user.is_authenticated:
+            return EMPTY
+        if shared_cache():
+            version = current_version(user.pk)
+        else:
+            version = user.version
+        with self.lock:
+            entry = self.entries.get(user.pk)
+            if entry is not None and entry.version == version and (
+                    time.monotonic() - entry.loaded
+                    < settings.MEMBERSHIP_TTL):
+                self.entries.move_to_end(user.pk)
+                return entry.membership
+        membership = load(user.pk)
+        with self.lock:
+            self.discard(user.pk)
+            entry = self.entries[user.pk] = Entry(version, membership)
+            self.size += entry.size
+            while (self.size > settings.MEMBERSHIP_CACHE_BYTES
+                   and len(self.entries) > 1):
+                self.discard(next(iter(self.entries)))
+        return membership
+
+    def changed(self, user_id, model, ids, added):
+        """
+        Изменение зафиксировано: увеличить версию и, если
+        запись процесса была актуальной, поправить ее на месте.
+        """
+        if not shared_cache():
+            with self.lock:
+                self.discard(user_id)
+            return
+        try:
+            version = cache.incr(version_key(user_id))
+        except ValueError:
+            version = None
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return
+            if version is None or entry.version + 1 != version:
+                self.discard(user_id)
+                return
+            values = getattr(entry.membership, KINDS[model][0])
+            if added:
+                values.update(ids)
+            else:
+                values.difference_update(ids)
+            entry.version = version
+            self.size -= entry.size
+            entry.size = entry.membership.size()
+            self.size += entry.size
+
+    def discard(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+def version_key(user_id):
+    return f'membership:{user_id}'
+
+
+def current_version(user_id):
+    """
+    Версия множеств пользователя. Начальная версия - время
+    в миллисекундах, чтобы после вытеснения ключа из кеша
+    версии не повторялись.
+    """
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def load(user_id):
+    return Membership(*(
+        model.objects.filter(user_id=user_id).values_list(field, flat=True)
+        for model, (_, field) in KINDS.items()))
+
+
+store = MembershipStore()
+
+
+def get(request):
+    """
+    Множества избранного, корзины и подписок пользователя
+    запроса. Запоминаются на запросе до его завершения.
+    """
+    http_request = getattr(request, '_request', request)
+    membership = getattr(http_request, '_membership', None)
+    if membership is None:
+        membership = http_request._membership = store.get(request.user)
+    return membership
+
+
+def add(user, model, ids):
+    """Пользователь добавил объекты ids в model."""
+    changed(user, model, ids, True)
+
+
+def remove(user, model, ids):
+    """Пользователь удалил объекты ids из model."""
+    changed(user, model, ids, False)
+
+
+def changed(user, model, ids, added):
+    if not ids:
+        return
+    if not shared_cache():
+        bump_users([user.pk])
+    ids = list(ids)
+    transaction.on_commit(
+        lambda: store.changed(user.pk, model, ids, added))
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Объединение повторов ингредиентов перед добавлением ограничения.
+    Рецепты переходят на первый из повторов; если в рецепте их
+    несколько, количество суммируется в одной строке.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientIn = apps.get_model('recipes', 'IngredientIn')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        group = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        )
+        rows = IngredientIn.objects.filter(ingredient__in=group)
+        merged = rows.values('recipe_id').annotate(
+            row=Min('id'), total=Count('id'), total_amount=Sum('amount')
+        ).filter(total__gt=1)
+        for recipe in merged:
+            rows.filter(recipe_id=recipe['recipe_id']).exclude(
+                id=recipe['row']).delete()
+            IngredientIn.objects.filter(id=recipe['row']).update(
+                ingredient_id=duplicate['keep'],
+                amount=recipe['total_amount'])
+        rows.exclude(ingredient_id=duplicate['keep']).update(
+            ingredient_id=duplicate['keep'])
+        group.exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_alter_follow_created'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
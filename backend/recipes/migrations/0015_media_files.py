@@ -0,0 +1,51 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:46
+
+from django.db import migrations, models
+from django.db.models import Count
+import recipes.storage
+
+
+def fill_media_files(apps, schema_editor):
+    """Файлы изображений рецептов с числом ссылок."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    images = Recipe.objects.exclude(image='').order_by().values(
+        'image').annotate(refs=Count('pk'))
+    variants = dict(Recipe.objects.exclude(image='').exclude(
+        image_variants={}).values_list('image', 'image_variants'))
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=row['image'], refs=row['refs'],
+                   variants=variants.get(row['image'], {}))
+         for row in images.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/'),
+        ),
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('variants', models.JSONField(blank=True, default=dict, verbose_name='Варианты')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'indexes': [models.Index(fields=['refs', 'updated_at'], name='mediafile_refs_updated_at')],
+            },
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
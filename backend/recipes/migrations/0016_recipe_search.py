@@ -0,0 +1,107 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION recipes_recipe_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_update
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_update()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+    'CREATE INDEX recipes_recipe_search ON recipes_recipe '
+    'USING gin (search_vector)',
+)
+
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX recipes_recipe_search',
+    'DROP TRIGGER recipes_recipe_search_update ON recipes_recipe',
+    'DROP FUNCTION recipes_recipe_search_update()',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+
+SQLITE_CREATE = """
+    CREATE VIRTUAL TABLE recipes_recipe_search USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')
+"""
+
+# Триггеры по именам: recipes.search пересоздает по ним
+# пропавшие после миграций триггеры.
+SQLITE_TRIGGERS = {
+    'recipes_recipe_search_insert': """
+    CREATE TRIGGER recipes_recipe_search_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_search(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    'recipes_recipe_search_delete': """
+    CREATE TRIGGER recipes_recipe_search_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_search(
+            recipes_recipe_search, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    'recipes_recipe_search_update': """
+    CREATE TRIGGER recipes_recipe_search_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_search(
+            recipes_recipe_search, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_search(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+}
+
+SQLITE_REBUILD = ("INSERT INTO recipes_recipe_search(recipes_recipe_search) "
+                  "VALUES ('rebuild')")
+
+SQLITE_FORWARD = (SQLITE_CREATE, *SQLITE_TRIGGERS.values(), SQLITE_REBUILD)
+
+SQLITE_BACKWARD = (
+    'DROP TRIGGER recipes_recipe_search_update',
+    'DROP TRIGGER recipes_recipe_search_delete',
+    'DROP TRIGGER recipes_recipe_search_insert',
+    'DROP TABLE recipes_recipe_search',
+)
+
+
+def run(statements):
+    """Выполнить SQL для PostgreSQL или SQLite, на других базах ничего."""
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+    """
+    Полнотекстовый поиск рецептов по названию и описанию.
+    PostgreSQL: столбец search_vector с весами A (название)
+    и B (описание), заполняемый триггером, и GIN-индекс по нему.
+    SQLite: таблица FTS5 над рецептами, которую ведут триггеры.
+    """
+
+    dependencies = [
+        ('recipes', '0015_media_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRESQL_FORWARD,
+                 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRESQL_BACKWARD,
+                 'sqlite': SQLITE_BACKWARD})),
+    ]
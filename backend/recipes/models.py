@@ -2,6 +2,12 @@ from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from users.models import CounterFieldsMixin
+
+from .storage import recipe_storage
 
 User = get_user_model()
 
@@ -14,6 +20,8 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'ингредиенты'
+        constraints = [models.UniqueConstraint(
+            fields=['name', 'measurement_unit'], name='unique_ingredient')]
 
     def __str__(self):
         """Вернет название ингредиента."""
@@ -35,8 +43,73 @@ class Tag(models.Model):
         return self.slug
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов."""
+
+    def with_viewer_flags(self, user):
+        """
+        Аннотирует рецепты флагами избранного и корзины текущего
+        пользователя и подпиской на автора рецепта.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Basket.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_author_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author'))),
+        )
+
+    def with_viewer_state(self, user):
+        """
+        Аннотирует рецепты состоянием для текущего пользователя
+        и подгружает связи, чтобы сериализация страницы рецептов
+        выполнялась за постоянное число запросов.
+        """
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, following=OuterRef('pk'))))
+        else:
+            authors = authors.annotate(is_subscribed=Value(False))
+        return self.with_viewer_flags(user).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch('ingredientsrecipes',
+                     queryset=IngredientIn.objects.select_related(
+                         'ingredient')),
+        )
+
+    def first_per_author(self, limit=None):
+        """
+        Первые limit рецептов каждого автора по id. Номер рецепта
+        у автора считается оконной функцией ROW_NUMBER(),
+        поэтому рецепты всех авторов выбираются одним запросом.
+        """
+        queryset = self.order_by('id')
+        if limit is None:
+            return queryset
+        return queryset.annotate(author_row=Window(
+            RowNumber(), partition_by=F('author_id'), order_by=F('id').asc(),
+        )).filter(author_row__lte=limit)
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
+    IMAGE_READY = 'ready'
+    IMAGE_PENDING = 'pending'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
     name = models.CharField(max_length=200)
     tags = models.ManyToManyField(Tag, verbose_name='Тэги')
     ingredients = models.ManyToManyField(
@@ -47,11 +120,24 @@ class Recipe(models.Model):
     text = models.TextField('Описание',
                             help_text='Введите описание рецепта')
     image = models.ImageField(
-        upload_to='recipes/', blank=True)
+        upload_to='recipes/', blank=True, storage=recipe_storage)
+    image_variants = models.JSONField(
+        'Варианты изображения', default=dict, blank=True, editable=False)
+    image_status = models.CharField(
+        'Состояние изображения', max_length=10, choices=IMAGE_STATUSES,
+        default=IMAGE_READY, editable=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='recipes',
                                verbose_name='Автор рецепта')
     pub_date = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False)
+    counter_fields = ('favorites_count', 'in_carts_count')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         """
@@ -61,6 +147,8 @@ class Recipe(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [models.Index(fields=['author', '-pub_date', '-id'],
+                                name='recipe_author_pub_date')]
 
     def __str__(self):
         """Вернет название рецепта."""
@@ -185,3 +273,140 @@ class Favorite(models.Model):
     def __str__(self):
         """Вернет информацию об избранном."""
         return f'{self.user} добавил в избранное {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель суммарного количества ингредиента
+    по всем рецептам в корзине пользователя.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='shopping_list_items')
+    amount = models.PositiveIntegerField('Количество', default=0)
+
+    class Meta:
+        """
+        Создание уникальных пар между юзером и ингредиентом.
+        """
+        verbose_name = 'Продукт списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'], name='unique_shoppinglistitem')]
+
+    def __str__(self):
+        """Вернет продукт из списка покупок юзера."""
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class FeedEntry(models.Model):
+    """
+    Модель записи ленты: рецепт автора из подписок,
+    разосланный подписчику при публикации.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='feed')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='feed_entries')
+    pub_date = models.DateTimeField('Дата создания рецепта')
+
+    class Meta:
+        """
+        Создание уникальных пар между юзером и рецептом.
+        """
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты'
+        constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
+                                               name='unique_feedentry')]
+        indexes = [models.Index(fields=['user', '-pub_date', '-recipe'],
+                                name='feedentry_user_pub_date')]
+
+    def __str__(self):
+        """Вернет юзера и рецепт."""
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class ImageJob(models.Model):
+    """
+    Модель задачи фоновой обработки загруженного изображения
+    рецепта. Задача существует, пока загрузка актуальна:
+    выполненная задача удаляется, а новая загрузка удаляет
+    прежние задачи рецепта. run_after - время, с которого
+    задачу можно взять; у выполняемой задачи это срок
+    блокировки, после которого ее заберет другой обработчик.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='image_jobs')
+    upload = models.CharField('Файл загрузки', max_length=255)
+    status = models.CharField('Состояние', max_length=10, choices=STATUSES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    run_after = models.DateTimeField('Выполнить после', default=timezone.now)
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        """
+        Очередь выбирается по состоянию и времени запуска.
+        """
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        indexes = [models.Index(fields=['status', 'run_after'],
+                                name='imagejob_status_run_after')]
+
+    def __str__(self):
+        """Вернет рецепт и состояние задачи."""
+        return f'{self.recipe_id}: {self.get_status_display()}'
+
+
+class MediaFile(models.Model):
+    """
+    Модель файла изображения в хранилище по хешу содержимого
+    с его вариантами. refs - число рецептов с этим изображением:
+    файлы без ссылок удаляет команда collect_media.
+    """
+    name = models.CharField('Файл', max_length=255, unique=True)
+    variants = models.JSONField('Варианты', default=dict, blank=True)
+    refs = models.PositiveIntegerField('Ссылки', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        """
+        Файлы без ссылок выбираются по числу ссылок и дате.
+        """
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        indexes = [models.Index(fields=['refs', 'updated_at'],
+                                name='mediafile_refs_updated_at')]
+
+    def __str__(self):
+        """Вернет имя файла и число ссылок."""
+        return f'{self.name} ({self.refs})'
+
+
+class Version(models.Model):
+    """
+    Версия справочника - время его последнего изменения.
+    Дублирует версию в кеше Django для процессов без общего
+    кеша (recipes.versions).
+    """
+    name = models.CharField('Справочник', max_length=50, primary_key=True)
+    value = models.FloatField('Версия')
+
+    class Meta:
+        """Название в админке."""
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        """Вернет справочник и версию."""
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,88 @@
+import re
+from importlib import import_module
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+CONFIG = 'russian'
+SQLITE_TABLE = 'recipes_recipe_search'
+SQLITE_WEIGHTS = (10.0, 1.0)
+# Триггеры FTS5 определены один раз - в миграции, создающей таблицу.
+SQLITE_TRIGGERS = import_module(
+    'recipes.migrations.0016_recipe_search').SQLITE_TRIGGERS
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты queryset, в названии или описании которых есть
+    слова text, с релевантностью rank, от лучших к худшим.
+    PostgreSQL ищет по столбцу search_vector через GIN-индекс
+    с учетом морфологии, SQLite - по таблице FTS5 по началам
+    слов.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        queryset = postgresql_search(queryset, text)
+    else:
+        queryset = sqlite_search(queryset, text)
+    return queryset.order_by('-rank', '-id')
+
+
+def postgresql_search(queryset, text):
+    query = SearchQuery(text, config=CONFIG, search_type='websearch')
+    vector = RawSQL(f'{queryset.model._meta.db_table}.search_vector', [],
+                    output_field=SearchVectorField())
+    return queryset.alias(search_vector=vector).filter(
+        search_vector=query).annotate(rank=SearchRank(vector, query))
+
+
+def sqlite_search(queryset, text):
+    """
+    Совпадения отбираются подзапросом к таблице FTS5, а bm25
+    считается коррелированным подзапросом с условием на rowid:
+    FTS5 находит строку по rowid, не перебирая совпадения.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return queryset.none().annotate(rank=Value(0.0))
+    match = ' '.join(f'"{word}"*' for word in words)
+    weights = ', '.join(map(str, SQLITE_WEIGHTS))
+    table = queryset.model._meta.db_table
+    matched = RawSQL(
+        f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s',
+        [match])
+    rank = RawSQL(
+        f'SELECT -bm25({SQLITE_TABLE}, {weights}) FROM {SQLITE_TABLE} '
+        f'WHERE {SQLITE_TABLE} MATCH %s AND rowid = {table}.id',
+        [match], output_field=FloatField())
+    return queryset.filter(id__in=matched).annotate(rank=rank)
+
+
+def restore_sqlite_triggers(using):
+    """
+    Пересоздать триггеры таблицы FTS5, если их нет, и
+    перестроить ее. SQLite меняет схему таблицы пересозданием:
+    миграция, изменившая таблицу рецептов после 0016, удаляет
+    ее триггеры, и изменения рецептов перестают попадать
+    в поиск. Вернет число пересозданных триггеров.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name = %s OR (type = 'trigger' AND tbl_name = %s)",
+            [SQLITE_TABLE, 'recipes_recipe'])
+        existing = {name for _, name in cursor.fetchall()}
+        missing = [statement for name, statement in SQLITE_TRIGGERS.items()
+                   if name not in existing]
+        if SQLITE_TABLE not in existing or not missing:
+            return 0
+        for statement in missing:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) "
+                       "VALUES ('rebuild')")
+    return len(missing)
@@ -0,0 +1,214 @@
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Basket, IngredientIn, ShoppingListItem
+
+suspended = ContextVar('shopping_list_suspended', default=False)
+deleting_recipes = weakref.WeakKeyDictionary()
+
+
+def recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return Counter(dict(IngredientIn.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount')))
+
+
+def apply_deltas(user_ids, deltas):
+    """
+    Прибавить к спискам покупок пользователей user_ids
+    количества deltas {ингредиент: разница}.
+    Недостающие строки создаются с нулем, затем одно UPDATE
+    прибавляет разницу, поэтому параллельные запросы не теряют
+    изменений. Обнулившиеся строки удаляются.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0),
+        ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(amount=Greatest(F('amount') + Case(
+        *(When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()),
+        output_field=IntegerField()), 0))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(amount=0).delete()
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return Counter(dict(IngredientIn.objects.filter(
+        recipe_id__in=recipe_ids).order_by().values(
+            'ingredient_id').annotate(total=Sum('amount')).values_list(
+                'ingredient_id', 'total')))
+
+
+def add_recipe(user, recipe):
+    """Рецепт добавлен в корзину."""
+    apply_deltas([user.id], recipe_amounts(recipe))
+
+
+def remove_recipe(user, recipe):
+    """Рецепт удален из корзины."""
+    apply_deltas([user.id], {pk: -amount for pk, amount
+                             in recipe_amounts(recipe).items()})
+
+
+def add_recipes(user, recipe_ids):
+    """Рецепты recipe_ids добавлены в корзину."""
+    if recipe_ids:
+        apply_deltas([user.id], recipes_amounts(recipe_ids))
+
+
+def remove_recipes(user, recipe_ids):
+    """Рецепты recipe_ids удалены из корзины."""
+    if recipe_ids:
+        apply_deltas([user.id], {pk: -amount for pk, amount
+                                 in recipes_amounts(recipe_ids).items()})
+
+
+def update_recipe(recipe, old_amounts, new_amounts=None):
+    """
+    Ингредиенты рецепта изменены: разница с old_amounts
+    применяется ко всем корзинам с этим рецептом.
+    Если new_amounts не переданы, они читаются из базы.
+    """
+    deltas = Counter(recipe_amounts(recipe) if new_amounts is None
+                     else new_amounts)
+    deltas.subtract(old_amounts)
+    apply_deltas(basket_users(recipe), deltas)
+
+
+def delete_recipe(recipe):
+    """Рецепт удаляется: вызывается до удаления корзин с ним."""
+    apply_deltas(basket_users(recipe), {
+        pk: -amount for pk, amount in recipe_amounts(recipe).items()})
+
+
+def basket_users(recipe):
+    return Basket.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True)
+
+
+def expected_items(user_ids):
+    """Список покупок, пересчитанный по корзинам."""
+    return {
+        (row['recipe__baskets__user'], row['ingredient']): row['total']
+        for row in IngredientIn.objects.filter(
+            recipe__baskets__user__in=user_ids
+        ).values('recipe__baskets__user', 'ingredient').annotate(
+            total=Sum('amount')).order_by()
+    }
+
+
+def stored_items(user_ids):
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in
+        ShoppingListItem.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'ingredient_id', 'amount')
+    }
+
+
+def find_mismatches(user_ids):
+    """
+    Расхождения сохраненного списка покупок с корзинами:
+    [(юзер, ингредиент, ожидается, сохранено)].
+    """
+    expected, stored = expected_items(user_ids), stored_items(user_ids)
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        if expected.get(key, 0) != stored.get(key, 0):
+            mismatches.append(
+                (*key, expected.get(key, 0), stored.get(key, 0)))
+    return sorted(mismatches)
+
+
+def rebuild(user_ids):
+    """Пересобрать списки покупок пользователей по их корзинам."""
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=amount)
+        for (user_id, ingredient_id), amount in
+        expected_items(user_ids).items())
+
+
+@contextmanager
+def signals_suspended():
+    """
+    Списки покупок в блоке ведет вызывающий код явными
+    вызовами: сигналы корзин и ингредиентов рецептов их
+    не меняют. Нужен там, где изменения применяются пачкой.
+    """
+    token = suspended.set(True)
+    try:
+        yield
+    finally:
+        suspended.reset(token)
+
+
+def tracked(recipe_id, origin=None):
+    """
+    Вести ли список по сигналу изменения корзины или
+    ингредиента рецепта recipe_id. Удаление рецепта
+    учитывается целиком до удаления, поэтому каскадные
+    удаления его корзин и ингредиентов в том же удалении
+    origin пропускаются.
+    """
+    if suspended.get():
+        return False
+    return origin is None or recipe_id not in deleting_recipes.get(
+        origin, ())
+
+
+def negated(amounts):
+    return {pk: -amount for pk, amount in amounts.items()}
+
+
+def basket_saved(basket, old):
+    """Корзина создана или изменена, old - прежние (юзер, рецепт)."""
+    if old is not None:
+        apply_deltas([old[0]], negated(recipe_amounts(old[1])))
+    apply_deltas([basket.user_id], recipe_amounts(basket.recipe_id))
+
+
+def basket_deleted(basket):
+    apply_deltas([basket.user_id], negated(recipe_amounts(basket.recipe_id)))
+
+
+def ingredient_saved(item, old):
+    """
+    Ингредиент рецепта создан или изменен, old - прежние
+    (рецепт, ингредиент, количество).
+    """
+    if old is not None:
+        apply_deltas(basket_users(old[0]), {old[1]: -old[2]})
+    apply_deltas(basket_users(item.recipe_id),
+                 {item.ingredient_id: item.amount})
+
+
+def ingredient_deleted(item):
+    apply_deltas(basket_users(item.recipe_id),
+                 {item.ingredient_id: -item.amount})
+
+
+def recipe_deleting(recipe, origin):
+    """
+    Рецепт удаляется (pre_delete) удалением origin: его
+    ингредиенты вычитаются из всех корзин, пока корзины есть.
+    """
+    if not suspended.get():
+        delete_recipe(recipe)
+    if origin is not None:
+        deleting_recipes.setdefault(origin, set()).add(recipe.pk)
@@ -0,0 +1,87 @@
+from django.db import router
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import search, shopping_list
+from .models import Basket, Ingredient, IngredientIn, Recipe, Tag, User
+from .versions import bump_version
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(**kwargs):
+    """Сброс индекса ингредиентов при изменении справочника."""
+    bump_version('ingredients')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(**kwargs):
+    """Новая версия списка тегов при изменении тега."""
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver([post_save, post_delete], sender=User)
+def list_changed(**kwargs):
+    """Сброс кешированных размеров списков."""
+    bump_version('counts')
+
+
+@receiver(pre_save, sender=Basket)
+@receiver(pre_save, sender=IngredientIn)
+def remember_old_row(sender, instance, **kwargs):
+    """
+    Прежние значения изменяемой корзины или ингредиента
+    рецепта: по ним из списков покупок вычитается старое.
+    """
+    instance._shopping_list_old = None
+    if instance.pk is not None and not shopping_list.suspended.get():
+        fields = (('user_id', 'recipe_id') if sender is Basket
+                  else ('recipe_id', 'ingredient_id', 'amount'))
+        instance._shopping_list_old = sender.objects.filter(
+            pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=Basket)
+def basket_saved(instance, **kwargs):
+    """Списки покупок при изменении корзины, в том числе в админке."""
+    if shopping_list.tracked(instance.recipe_id):
+        shopping_list.basket_saved(
+            instance, getattr(instance, '_shopping_list_old', None))
+
+
+@receiver(post_delete, sender=Basket)
+def basket_deleted(instance, origin=None, **kwargs):
+    if shopping_list.tracked(instance.recipe_id, origin):
+        shopping_list.basket_deleted(instance)
+
+
+@receiver(post_save, sender=IngredientIn)
+def ingredient_saved(instance, **kwargs):
+    """Списки покупок при изменении ингредиентов рецепта."""
+    if shopping_list.tracked(instance.recipe_id):
+        shopping_list.ingredient_saved(
+            instance, getattr(instance, '_shopping_list_old', None))
+
+
+@receiver(post_delete, sender=IngredientIn)
+def ingredient_deleted(instance, origin=None, **kwargs):
+    if shopping_list.tracked(instance.recipe_id, origin):
+        shopping_list.ingredient_deleted(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, origin=None, **kwargs):
+    """
+    Удаление рецепта, в том числе каскадное при удалении
+    автора: продукты рецепта вычитаются из списков покупок.
+    """
+    shopping_list.recipe_deleting(instance, origin)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """Триггеры поиска на SQLite после миграций рецептов."""
+    if (sender.name == 'recipes'
+            and router.allow_migrate_model(using, Recipe)):
+        search.restore_sqlite_triggers(using)
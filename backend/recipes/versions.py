@@ -0,0 +1,98 @@
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+from users.models import User
+
+from .models import Version
+
+
+STORED_VERSIONS = ('tags', 'ingredients')
+
+
+def get_version(name):
+    """Версия справочника name - время последнего изменения."""
+    return get_versions(name)[0]
+
+
+def get_versions(*names):
+    """
+    Версии справочников names. Хранятся в кэше, поэтому
+    чтение не обращается к базе. Версии STORED_VERSIONS, по
+    которым строятся ETag, хранятся еще и в базе (Version):
+    без общего кеша версии в кеше у процессов расходятся,
+    и эти версии читаются из базы одним запросом.
+    """
+    stored = []
+    if not shared_cache():
+        stored = [name for name in names if name in STORED_VERSIONS]
+    versions = {}
+    if stored:
+        versions = dict(Version.objects.filter(
+            name__in=stored).values_list('name', 'value'))
+    keys = {name: f'version:{name}' for name in names if name not in stored}
+    cached = cache.get_many(keys.values())
+    for name, key in keys.items():
+        versions[name] = cached.get(key)
+    return tuple(
+        versions.get(name)
+        or (bump_version(name) if name in stored else cache_version(name))
+        for name in names)
+
+
+def bump_version(name):
+    """Отметить изменение справочника name."""
+    version = cache_version(name)
+    if name in STORED_VERSIONS:
+        Version.objects.update_or_create(
+            name=name, defaults={'value': version})
+    return version
+
+
+def cache_version(name):
+    """
+    Новая версия name в кеше. При промахе кеша база не
+    меняется: с общим кешем версии из нее не читаются.
+    """
+    version = time.time()
+    cache.set(f'version:{name}', version, None)
+    return version
+
+
+def bump_users(pks, stored=True):
+    """
+    Отметить изменение пользователей pks: кешированные
+    объекты пользователей устарели. Версии в кеше меняются
+    после фиксации транзакции: иначе параллельный запрос мог
+    бы прочитать еще старую строку и закешировать ее с новой
+    версией. Версия в базе (User.version) увеличивается сразу,
+    в транзакции изменения; stored=False - вызывающий уже
+    увеличил ее своим UPDATE (next_user_version).
+    """
+    pks = list(pks)
+    if stored:
+        User.objects.filter(pk__in=pks).update(version=next_user_version())
+    transaction.on_commit(lambda: cache.set_many(
+        {f'version:user:{pk}': time.time() for pk in pks}, None))
+
+
+def next_user_version():
+    return F('version') + 1
+
+
+def stored_user_version(pk):
+    """Версия пользователя pk в базе; None, если его нет."""
+    return User.objects.filter(pk=pk).values_list(
+        'version', flat=True).first()
+
+
+def shared_cache():
+    """
+    Общий ли кеш Django для всех процессов. Кеш в памяти
+    процесса и пустой кеш - нет: версии в них видит только
+    процесс, который их изменил.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
@@ -12,7 +12,9 @@ class UserAdmin(admin.ModelAdmin):
                     'username',
                     'first_name',
                     'last_name',
-                    'email')
+                    'email',
+                    'recipes_count',
+                    'followers_count')
     search_fields = ('username', 'email')
     list_filter = ('username', 'email')
     empty_value_display = '-empty-'
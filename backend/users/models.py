@@ -2,11 +2,44 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Счетчики counter_fields меняются только UPDATE с F()
+    (recipes.counters). Полное сохранение загруженного объекта
+    (админка, смена пароля, сериализаторы) их не записывает:
+    иначе в базу вернулись бы значения, прочитанные вместе
+    с объектом. Записать счетчики можно, только явно указав
+    их в update_fields.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Класс для Юзера."""
     email = models.EmailField(max_length=254, db_index=True, unique=True)
     first_name = models.TextField(max_length=254)
     last_name = models.TextField(max_length=254)
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
+    following_count = models.PositiveIntegerField(
+        'Подписок', default=0, editable=False)
+    version = models.PositiveBigIntegerField(
+        'Версия', default=0, editable=False)
+    counter_fields = ('recipes_count', 'followers_count', 'following_count',
+                      'version')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name']
 
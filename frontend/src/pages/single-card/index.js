@@ -42,6 +42,8 @@ const SingleCard = ({ loadItem, updateOrders }) => {
   const {
     author = {},
     image,
+    image_variants = {},
+    image_srcset = {},
     tags,
     cooking_time,
     name,
@@ -59,7 +61,16 @@ const SingleCard = ({ loadItem, updateOrders }) => {
         <meta property="og:title" content={name} />
       </MetaTags>
       <div className={styles['single-card']}>
-        <img src={image} alt={name} className={styles["single-card__image"]} />
+        {image && <picture className={styles['single-card__picture']}>
+          {image_srcset.webp && <source type='image/webp' srcSet={image_srcset.webp} sizes='(max-width: 800px) 100vw, 480px' />}
+          <img
+            src={(image_variants.detail && image_variants.detail.jpeg) || image}
+            srcSet={image_srcset.jpeg}
+            sizes='(max-width: 800px) 100vw, 480px'
+            alt={name}
+            className={styles["single-card__image"]}
+          />
+        </picture>}
         <div className={styles["single-card__info"]}>
           <div className={styles["single-card__header-info"]}>
               <h1 className={styles["single-card__title"]}>{name}</h1>
@@ -4,6 +4,7 @@ import { useTags } from './use-tags'
 import useRecipes from './use-recipes'
 import useRecipe from './use-recipe'
 import useSubscriptions from './use-subscriptions'
+import recipeImage from './recipe-image'
 
 export {
   hexToRgba,
@@ -12,5 +13,6 @@ export {
   useTags,
   useRecipes,
   useRecipe,
-  useSubscriptions
+  useSubscriptions,
+  recipeImage
 }
\ No newline at end of file
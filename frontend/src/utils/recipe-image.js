@@ -0,0 +1,8 @@
+import placeholder from '../images/recipe-placeholder.svg'
+
+const recipeImage = ({ image, image_variants }, variant = 'card', format = 'webp') => {
+  const variants = (image_variants && image_variants[variant]) || {}
+  return variants[format] || image || placeholder
+}
+
+export default recipeImage